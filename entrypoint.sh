@@ -2,4 +2,17 @@
 python manage.py migrate --no-input
 python manage.py collectstatic --no-input
 
-gunicorn labs.wsgi:application -w 5 --bind 0.0.0.0:8000
+if [ "$METRICS_ENABLED" = "true" ]; then
+    # metric files of the workers of a previous run
+    export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/labs-metrics}"
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+if [ "$SERVER_MODE" = "asgi" ]; then
+    # event loop workers, read heavy API endpoints are served by async views
+    export ASYNC_API="${ASYNC_API:-true}"
+    gunicorn labs.asgi:application -w 5 -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
+else
+    gunicorn labs.wsgi:application -w 5 --bind 0.0.0.0:8000
+fi
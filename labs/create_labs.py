@@ -21,3 +21,5 @@ for d in range(2, 12):
 
     link = models.LinkTopicEvent(event=event, topic=topic)
     link.save()
+
+models.LabEvent.refresh_counters()
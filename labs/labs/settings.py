@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+from datetime import timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -46,13 +47,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "main.middleware.QueryBudgetMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "main.middleware.MetricsMiddleware",
+    "main.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "main.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "labs.urls"
@@ -83,6 +89,8 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # writers queue for the database lock during registration rush
+        "OPTIONS": {"timeout": 20},
     }
 }
 
@@ -96,6 +104,47 @@ if os.getenv("USE_SQLITE", "0") == "0":
         "PORT": os.getenv("LABS_DB_PORT"),
     }
 
+    # bounded pool of connections per process instead of one connection per request
+    if os.getenv("DB_POOL", "false").lower() == "true":
+        DATABASES["default"]["ENGINE"] = "main.backends.pooled_mysql"
+        DATABASES["default"]["POOL"] = {
+            "SIZE": int(os.getenv("DB_POOL_SIZE", "5")),
+            "TIMEOUT": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            "MAX_LIFETIME": float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+            "PING_AFTER": float(os.getenv("DB_POOL_PING_AFTER", "0")),
+        }
+
+# MySQL skips the partial free seat index of `LinkTopicEvent`, the others still apply
+SILENCED_SYSTEM_CHECKS = ["models.W037"]
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# must be shared by all gunicorn workers in production (file or redis),
+# versioned keys are bumped by signals in `main.signals`
+
+CACHE_BACKENDS = {
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "labs"),
+    "file": (
+        "django.core.cache.backends.filebased.FileBasedCache",
+        str(BASE_DIR / ".cache"),
+    ),
+    "redis": (
+        "django.core.cache.backends.redis.RedisCache",
+        "redis://127.0.0.1:6379/0",
+    ),
+}
+CACHE_BACKEND, CACHE_DEFAULT_LOCATION = CACHE_BACKENDS[
+    os.getenv("CACHE_BACKEND", "file")
+]
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": os.getenv("CACHE_LOCATION", CACHE_DEFAULT_LOCATION),
+        "KEY_PREFIX": "labs",
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -133,6 +182,22 @@ USE_TZ = True
 STATIC_ROOT = BASE_DIR / "static"
 STATIC_URL = "static/"
 
+# `collectstatic` writes content hashed copies of the files with gzip and
+# brotli variants next to them, WhiteNoise serves those with far future
+# immutable cache headers (sendfile under gunicorn). The hashed names come
+# from the manifest of `collectstatic`, development and tests go without it.
+STATIC_MANIFEST = os.getenv("STATIC_MANIFEST", str(not DEBUG)).lower() == "true"
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"
+        if STATIC_MANIFEST
+        else "django.contrib.staticfiles.storage.StaticFilesStorage"
+    },
+}
+# of the files without a hash in the name
+WHITENOISE_MAX_AGE = 60 * 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -141,3 +206,69 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # added
 LOGIN_URL = "login/"
 AUTH_USER_MODEL = "main.CustomUser"
+
+# `main.middleware.CompressionMiddleware`
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_CONTENT_TYPES = {"application/json", "text/csv"}
+
+# sessions and the users of requests from the default cache, which must be
+# shared by the workers; sessions are written through to the database, so a
+# flushed cache logs nobody out.
+SESSION_CACHE = os.getenv("SESSION_CACHE", "false").lower() == "true"
+if SESSION_CACHE:
+    SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+    # new logins use the cached backend, sessions from before keep resolving
+    # through the backend path stored in them
+    AUTHENTICATION_BACKENDS = [
+        "main.auth.CachedModelBackend",
+        "django.contrib.auth.backends.ModelBackend",
+    ]
+
+# async views of the read heavy API endpoints, for the ASGI deployment
+ASYNC_API = os.getenv("ASYNC_API", "false").lower() == "true"
+
+# Prometheus metrics at `/api/metrics` for staff or with the bearer token,
+# recorded by `main.middleware.MetricsMiddleware` and summed over all
+# workers from their files in `PROMETHEUS_MULTIPROC_DIR`, see `main.metrics`
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+if METRICS_ENABLED:
+    # before `prometheus_client` is imported
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", str(BASE_DIR / "metrics"))
+    Path(os.environ["PROMETHEUS_MULTIPROC_DIR"]).mkdir(parents=True, exist_ok=True)
+
+# Profiles of staff requests with `X-Profile` or `?_profile`, written to
+# `PROFILING_DIR` by `main.profiling.ProfilingMiddleware` when enabled
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_DIR = Path(os.getenv("PROFILING_DIR", BASE_DIR / "profiles"))
+
+# Query budgets per URL name, checked by `main.middleware.QueryBudgetMiddleware`
+# when enabled, exceeding requests are logged and get `X-Query-Budget-Exceeded`
+QUERY_BUDGET_ENABLED = os.getenv("QUERY_BUDGET_ENABLED", "false").lower() == "true"
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", "10"))
+QUERY_BUDGETS: dict[str, int] = {
+    "home": 2,
+    "apply_event": 12,
+    "my_labs": 3,
+    "approve_page": 3,
+    "api_topics": 1,
+    "api_events": 4,
+    "api_event_seats": 4,
+    "api_my_labs": 3,
+    "api_register_requests": 3,
+    "api_export_closed": 3,
+    "api_export_history": 3,
+    "api_export_jobs": 5,
+    "api_export_job": 3,
+    "api_export_job_download": 3,
+}
+
+# CSV files of `main.models.ExportJob` written by the `run_export_jobs` worker,
+# deleted with their jobs `EXPORT_RETENTION_HOURS` after finishing
+EXPORT_ROOT = Path(os.getenv("EXPORT_ROOT", BASE_DIR / "exports"))
+EXPORT_RETENTION = timedelta(hours=float(os.getenv("EXPORT_RETENTION_HOURS", "24")))
+# running jobs without a heartbeat (written every chunk of rows) for this
+# long lost their worker and are queued again
+EXPORT_JOB_TIMEOUT = timedelta(
+    minutes=float(os.getenv("EXPORT_JOB_TIMEOUT_MINUTES", "5"))
+)
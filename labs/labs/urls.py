@@ -15,16 +15,10 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include, re_path
-from django.conf import settings
-from django.views.static import serve
-
-static_urlpatterns = [
-    re_path("^static/(?P<path>.*)", serve, {"document_root": settings.STATIC_ROOT})
-]
+from django.urls import path, include
 
+# static files are served by `whitenoise.middleware.WhiteNoiseMiddleware`
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("", include("main.urls")),
-    path("", include(static_urlpatterns))
 ]
@@ -1,8 +1,9 @@
 from django.contrib import admin
-from .models import CustomUser, LabEvent, LabTopic, LinkTopicEvent
+from .models import CustomUser, ExportJob, LabEvent, LabTopic, LinkTopicEvent
 
 # Register your models here.
 admin.site.register(CustomUser)
 admin.site.register(LabEvent)
 admin.site.register(LabTopic)
 admin.site.register(LinkTopicEvent)
+admin.site.register(ExportJob)
@@ -1,19 +1,56 @@
+import hashlib
 from functools import wraps
-from django.http import HttpRequest, JsonResponse, HttpResponse
+from django.conf import settings
+from django.http import (
+    FileResponse,
+    HttpRequest,
+    JsonResponse,
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator, EmptyPage
 from django.shortcuts import get_object_or_404
 from django.db.utils import IntegrityError
-from django.db.models import Count
+from django.utils.cache import get_conditional_response
 from django.contrib.auth.decorators import login_required
-from .models import LabTopic, LabEvent, CustomUser, LinkTopicEvent
+from . import metrics
+from .forms import CreateScheduleForm
+from .models import (
+    LabTopic,
+    LabEvent,
+    CustomUser,
+    LinkTopicEvent,
+    RequestAction,
+    ExportKind,
+    ExportJob,
+)
+from .cache import (
+    TOPICS_VERSION_KEY,
+    FEED_VERSION_KEY,
+    FEED_CACHE_TIMEOUT,
+    get_event_versions,
+    get_version,
+)
+from .utils import MAX_PAGE_SIZE, InvalidCursor, keyset_page, iterate_in_chunks
 import json
 
+from django.db import models
 from django.utils import timezone
-from datetime import timedelta
+from django.utils.dateparse import parse_datetime
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from prometheus_client import CONTENT_TYPE_LATEST
+from datetime import datetime
 
 EVENTS_PER_PAGE: int = 3
 REQUESTS_PER_PAGE: int = 3
+MAX_BATCH_IDS: int = 1_000
+EXPORT_CHUNK_SIZE: int = 2_000
+TOPIC_CATALOG_TIMEOUT: int = 24 * 60 * 60
+# EventSource reconnect delay after a seats response ends
+SEATS_RETRY_MS: int = 5_000
 
 
 def unauthorized():
@@ -68,12 +105,29 @@ def new_topic(request: HttpRequest):
     return JsonResponse(lab_topic.json(), status=201)
 
 
+def get_topic_catalog() -> tuple[bytes, str]:
+    """Serialized topic list and its ETag, cached until a topic changes."""
+    key = f"topics:catalog:{get_version(TOPICS_VERSION_KEY)}"
+
+    if (catalog := cache.get(key)) is None:
+        topics = LabTopic.objects.select_related("created_by").order_by("id")
+        content = json.dumps([t.json() for t in topics]).encode("utf-8")
+        catalog = (content, f'"{hashlib.md5(content).hexdigest()}"')
+        cache.set(key, catalog, TOPIC_CATALOG_TIMEOUT)
+
+    return catalog
+
+
 def all_topics(request: HttpRequest):
     if request.method != "GET":
         return unauthorized()
 
-    topics = LabTopic.objects.all()
-    return JsonResponse([t.json() for t in topics], status=200, safe=False)
+    content, etag = get_topic_catalog()
+    response = get_conditional_response(request, etag=etag) or HttpResponse(
+        content, content_type="application/json", status=200
+    )
+    response["ETag"] = etag
+    return response
 
 
 @staff_or_403
@@ -120,38 +174,204 @@ def modify_topic(request: HttpRequest):
     return JsonResponse(lab_topic.json(), status=200)
 
 
+def get_my_labs(request: HttpRequest):
+    """Upcoming events of the user with the user's topic, the data of the my labs page."""
+    if request.user.is_anonymous:
+        return unauthenticated()
+
+    events = LabEvent.get_user_events(request.user)  # type: ignore
+    return JsonResponse({"content": [event.dashboard_json() for event in events]}, status=200)
+
+
+def parse_page_size(request: HttpRequest, default: int) -> int | None:
+    size = request.GET.get("size")
+    if size is None:
+        return default
+    if not size.isdigit() or int(size) < 1:
+        return None
+    return min(int(size), MAX_PAGE_SIZE)
+
+
+def invalid_page_size():
+    return JsonResponse(
+        {"message": "parameter `size` must be positive integer"}, status=400
+    )
+
+
+def keyset_content(queryset, field: str, cursor: str | None, size: int) -> dict:
+    rows, next_cursor = keyset_page(queryset, field, cursor, size)
+    return {
+        "content": [row.json() for row in rows],
+        "has_next": next_cursor is not None,
+        "next": next_cursor,
+    }
+
+
+def cursor_page(request: HttpRequest, queryset, field: str, default_size: int):
+    """Keyset paginated response, `cursor` param is the `next` value of the previous page"""
+    if (size := parse_page_size(request, default_size)) is None:
+        return invalid_page_size()
+
+    try:
+        content = keyset_content(queryset, field, request.GET.get("cursor"), size)
+    except InvalidCursor as e:
+        return JsonResponse({"message": str(e)}, status=400)
+
+    return JsonResponse(content, status=200)
+
+
+def get_feed_page(cursor: str | None, size: int) -> tuple[dict, str]:
+    """Feed page shared by all users and its cache key, cached until any event changes."""
+    key = f"feed:{get_version(FEED_VERSION_KEY)}:{size}:{cursor}"
+
+    if (content := cache.get(key)) is None:
+        content = keyset_content(LabEvent.get_feed(), "lab_datetime", cursor, size)
+        cache.set(key, content, FEED_CACHE_TIMEOUT)
+
+    return content, key
+
+
+def feed_etag(key: str, content: dict, applied: set[int]) -> str:
+    """ETag of a feed page as seen by a user. The key embeds the feed version,
+    the event ids change without it as events pass."""
+    event_ids = [event["id"] for event in content["content"]]
+    return f'"{hashlib.md5(f"{key}:{event_ids}:{sorted(applied)}".encode()).hexdigest()}"'
+
+
+def feed_response(request: HttpRequest, content: dict, key: str, applied: set[int]):
+    """The feed page with the user's `applied` flags, 304 if the client has it."""
+    etag = feed_etag(key, content, applied)
+    if (response := get_conditional_response(request, etag=etag)) is None:
+        for event in content["content"]:
+            event["applied"] = event["id"] in applied
+        response = JsonResponse(content, status=200)
+    response["ETag"] = etag
+    return response
+
+
 def get_lab_events(request: HttpRequest):
-    """page param starting from 1"""
+    """Without `page` param keyset paginated by `cursor`, otherwise page param starting from 1"""
     if request.user.is_anonymous:
         return unauthenticated()
 
     page = request.GET.get("page")
-    if page is None or not page.isdigit():
-        return JsonResponse({"message": "missing parameter `page` (int)"}, status=400)
+    if page is None:
+        if (size := parse_page_size(request, EVENTS_PER_PAGE)) is None:
+            return invalid_page_size()
+
+        try:
+            content, key = get_feed_page(request.GET.get("cursor"), size)
+        except InvalidCursor as e:
+            return JsonResponse({"message": str(e)}, status=400)
+
+        applied = LabEvent.get_applied_ids(
+            request.user, [event["id"] for event in content["content"]]
+        )
+        return feed_response(request, content, key, applied)
+
+    if not page.isdigit():
+        return JsonResponse({"message": "parameter `page` must be integer"}, status=400)
     page_int: int = int(page)
     if page_int < 0:
         return JsonResponse({"message": "page must be greater or equal 1"}, status=400)
 
-    events = (
-        LabEvent.objects.filter(lab_datetime__gt=timezone.now())
-        .filter(lab_datetime__gte=timezone.now())
-        .annotate(num_topics=Count("topics"))
-        .filter(num_topics__gte=1)
-        .order_by("lab_datetime")
-        .all()  # [EVENTS_PER_PAGE * (page_int - 1) : EVENTS_PER_PAGE * page_int]
-    )
-
-    paginator = Paginator(events, EVENTS_PER_PAGE)
+    paginator = Paginator(LabEvent.get_feed(request.user), EVENTS_PER_PAGE)
     try:
         page = paginator.page(page_int)
     except EmptyPage:
         return JsonResponse({"message": "no more pages"})
 
     return JsonResponse(
-        {"content": [event.json(request.user) for event in page], "has_next": page.has_next()}, status=200, safe=False  # type: ignore
+        {"content": [event.json() for event in page], "has_next": page.has_next()}, status=200, safe=False  # type: ignore
+    )
+
+
+@staff_or_403
+@handle_validation
+def create_schedule(request: HttpRequest):
+    """Create recurring events, payload has the fields of `CreateScheduleForm`
+    with dates as `YYYY-MM-DD HH:MM` and `topics` as a list of topic ids."""
+    if request.method != "POST":
+        return unauthorized()
+
+    try:
+        data = json.loads(request.body.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return JsonResponse({"message": "payload must be JSON"}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({"message": "payload must be JSON object"}, status=400)
+
+    topics = [(id, id) for id in LabTopic.objects.values_list("id", flat=True)]
+    form = CreateScheduleForm(topics, data)
+    if not form.is_valid():
+        return JsonResponse(
+            {
+                "message": "invalid schedule",
+                "error": "validation",
+                "fields": {k: [str(m) for m in v] for k, v in form.errors.items()},
+            },
+            status=422,
+        )
+
+    events = LabEvent.create_schedule(**form.schedule(), created_by=request.user)
+    return JsonResponse({"content": [event.json() for event in events]}, status=201)
+
+
+def parse_event_ids(request: HttpRequest) -> list[int] | None:
+    ids = request.GET.getlist("id")
+    if not ids or len(ids) > MAX_PAGE_SIZE or not all(id.isdigit() for id in ids):
+        return None
+    return list(dict.fromkeys(int(id) for id in ids))
+
+
+def invalid_event_ids():
+    return JsonResponse(
+        {"message": f"expected 1 to {MAX_PAGE_SIZE} integer `id` parameters"},
+        status=400,
+    )
+
+
+def seats_token(versions: dict[int, str]) -> str:
+    """SSE event id of the seats of events at `versions`."""
+    return hashlib.md5(json.dumps(sorted(versions.items())).encode()).hexdigest()
+
+
+def seats_message(versions: dict[int, str]) -> str:
+    data = json.dumps(LabEvent.get_seats(versions, versions))
+    return f"id: {seats_token(versions)}\nevent: seats\ndata: {data}\n\n"
+
+
+def seats_response(content) -> HttpResponse:
+    cls = HttpResponse if isinstance(content, str) else StreamingHttpResponse
+    return cls(
+        content,
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
+def event_seats(request: HttpRequest):
+    """Server-sent events with seat availability of the events given by `id` params.
+
+    A sync worker can not be held by an open stream, so the response carries
+    the current seats and ends. EventSource reconnects after `retry`
+    (`SEATS_RETRY_MS`) with `Last-Event-ID` and gets no message until a seat
+    of the events changes, so every client polls once per 5 s and learns of a
+    change up to 5 s late. The async view keeps the stream open instead, but
+    also polls the event versions in the cache, there is no fan-out of changes.
+    """
+    if request.user.is_anonymous:
+        return unauthenticated()
+    if (event_ids := parse_event_ids(request)) is None:
+        return invalid_event_ids()
+
+    versions = get_event_versions(event_ids)
+    content = f"retry: {SEATS_RETRY_MS}\n\n"
+    if request.headers.get("Last-Event-ID") != seats_token(versions):
+        content += seats_message(versions)
+    return seats_response(content)
+
+
 @staff_or_403
 def approve_user(request: HttpRequest, id: int):
     user = CustomUser.objects.get(pk=id)
@@ -176,6 +396,74 @@ def decline_user(request: HttpRequest, id: int):
     return JsonResponse({"message": f"nothing to cancel"}, status=200)
 
 
+def parse_pending_filter(data: dict) -> models.Q:
+    """Filter of pending requests from `email` (substring) and ISO datetimes
+    `joined_after`, `joined_before`."""
+    pending = models.Q()
+    if email := data.get("email"):
+        pending &= models.Q(email__icontains=str(email))
+    for key, lookup in (("joined_after", "gte"), ("joined_before", "lt")):
+        if (value := data.get(key)) is None:
+            continue
+        if (joined := parse_datetime(str(value))) is None:
+            raise ValueError(f"`{key}` must be an ISO datetime")
+        pending &= models.Q(**{f"date_joined__{lookup}": joined})
+    return pending
+
+
+@staff_or_403
+def resolve_requests(request: HttpRequest):
+    """Approve or decline many registration requests at once.
+
+    Payload is `{"action": "approve" | "decline", "ids": [...]}` or, for all
+    pending requests matching a filter, `{"action": ..., "filter": {...}}`
+    (see `parse_pending_filter`). Responds with the outcome per id.
+    """
+    if request.method != "POST":
+        return unauthorized()
+
+    try:
+        data = json.loads(request.body.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return JsonResponse({"message": "payload must be JSON"}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({"message": "payload must be JSON object"}, status=400)
+
+    try:
+        action = RequestAction(data.get("action"))
+    except ValueError:
+        actions = " or ".join(f"`{a.value}`" for a in RequestAction)
+        return JsonResponse({"message": f"`action` must be {actions}"}, status=400)
+
+    ids = data.get("ids")
+    if ids is not None:
+        # bool is an int too, `true` is not user 1
+        if (
+            not isinstance(ids, list)
+            or len(ids) > MAX_BATCH_IDS
+            or not all(isinstance(id, int) and not isinstance(id, bool) for id in ids)
+        ):
+            return JsonResponse(
+                {"message": f"`ids` must be a list of at most {MAX_BATCH_IDS} integers"},
+                status=400,
+            )
+        outcomes = CustomUser.resolve_requests(action, ids=ids)
+    elif isinstance(data.get("filter"), dict):
+        try:
+            pending = parse_pending_filter(data["filter"])
+        except ValueError as e:
+            # raised with the fixed messages of `parse_pending_filter`
+            return JsonResponse({"message": str(e)}, status=400)
+        outcomes = CustomUser.resolve_requests(action, pending=pending)
+    else:
+        return JsonResponse({"message": "payload must have `ids` or `filter`"}, status=400)
+
+    counts: dict[str, int] = {}
+    for outcome in outcomes.values():
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return JsonResponse({"results": outcomes, "counts": counts}, status=200)
+
+
 @staff_or_403
 def remove_user_from_event(request: HttpRequest, event_id: int, user_id: int):
     try:
@@ -186,65 +474,138 @@ def remove_user_from_event(request: HttpRequest, event_id: int, user_id: int):
     try:
         event = LabEvent.objects.get(pk=event_id)
     except LabEvent.DoesNotExist:
-        return JsonResponse({"message": f"Event `{user_id}` not found"}, status=404)
+        return JsonResponse({"message": f"Event `{event_id}` not found"}, status=404)
 
-    if (link := event.links.filter(user=user).first()) is None:  # type: ignore
+    if not event.release_seat(user):
         return JsonResponse(
-            {"message": f"User `{user_id}` is not applied for event `{user_id}`"},
+            {"message": f"User `{user_id}` is not applied for event `{event_id}`"},
             status=400,
         )
 
-    link.user = None
-    link.save()
-
     return JsonResponse({}, status=204)
 
 
-@staff_or_403
-def export_closed(request: HttpRequest):
-    now = timezone.now()
-    links = (
-        LinkTopicEvent.objects.filter(event__lab_datetime__gte=now - timedelta(days=1))
-        .filter(event__close_logout__lte=now)
-        .all()
+def export_validators(links) -> tuple[str, datetime | None]:
+    """ETag and Last-Modified of an export of `links`, by one query.
+
+    From the versions of the exported events, bumped by every change of
+    their links, and the last `LinkTopicEvent.date`. Renamed users alone do
+    not change them.
+    """
+    last_changes = dict(
+        links.order_by()
+        .values("event")
+        .annotate(last=models.Max("date"))
+        .values_list("event", "last")
     )
+    versions = sorted(get_event_versions(last_changes).items())
+    etag = f'"{hashlib.md5(repr(versions).encode()).hexdigest()}"'
+    return etag, max(last_changes.values(), default=None)
+
 
-    content: str = LinkTopicEvent.links_to_csv(links)
+def csv_response(request: HttpRequest, links, filename: str, export: str) -> HttpResponse:
+    """Stream `links` as CSV, rows are fetched in chunks together with their event, topic and user.
 
-    response = HttpResponse(content, content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="closed_labs.csv"'
+    Answered by 304 without running the export when the client has it.
+    """
+    etag, last_modified = export_validators(links)
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified and int(last_modified.timestamp()),
+    )
+    if response is None:
+        links = links.select_related("event", "topic", "user")
+        response = StreamingHttpResponse(
+            metrics.timed(
+                LinkTopicEvent.iter_csv(iterate_in_chunks(links, EXPORT_CHUNK_SIZE)),
+                metrics.EXPORT_DURATION.labels(export),
+            ),
+            content_type="text/csv",
+        )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
 
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
     return response
 
 
+@staff_or_403
+def export_closed(request: HttpRequest):
+    links = LinkTopicEvent.get_export(
+        ExportKind.CLOSED, *ExportKind.CLOSED.window(timezone.now())
+    )
+    return csv_response(request, links, "closed_labs.csv", "closed")
+
+
 @staff_or_403
 def export_history(request: HttpRequest):
-    now = timezone.now()
+    links = LinkTopicEvent.get_export(
+        ExportKind.HISTORY, *ExportKind.HISTORY.window(timezone.now())
+    )
+    return csv_response(request, links, "history_labs.csv", "history")
 
-    links = LinkTopicEvent.objects.filter(
-        event__lab_datetime__lte=now, event__lab_datetime__gte=now - timedelta(weeks=30)
-    ).all()
 
-    content: str = LinkTopicEvent.links_to_csv(links)
-    response = HttpResponse(content, content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="history_labs.csv"'
+@staff_or_403
+def export_jobs(request: HttpRequest):
+    """Queue an export of `{"kind": "closed" | "history"}` for the `run_export_jobs` worker.
 
-    return response
+    A pending, running or finished job of the same data is returned with 200
+    instead of queueing another one, a new job with 202.
+    """
+    if request.method != "POST":
+        return unauthorized()
+
+    try:
+        kind = ExportKind(json.loads(request.body.decode("utf-8")).get("kind"))
+    except (json.JSONDecodeError, AttributeError, ValueError):
+        return JsonResponse(
+            {"message": f"kind must be one of {', '.join(ExportKind.values)}"},
+            status=400,
+        )
+
+    start, end = kind.window(timezone.now())
+    etag, _ = export_validators(LinkTopicEvent.get_export(kind, start, end))
+    job, created = ExportJob.request(kind, etag, start, end, request.user)
+    return JsonResponse(job.json(), status=202 if created else 200)
 
 
 @staff_or_403
-def get_reqister_requests(request: HttpRequest) -> HttpResponse:
-    page: str | None = request.GET.get("page")
+def export_job(request: HttpRequest, id: int):
+    return JsonResponse(get_object_or_404(ExportJob, pk=id).json(), status=200)
 
-    if page is None:
-        return JsonResponse({"message": "missing parameter `page` (int)"}, status=400)
 
+@staff_or_403
+def export_job_download(request: HttpRequest, id: int):
+    job = get_object_or_404(ExportJob, pk=id)
+    if job.status != ExportJob.Status.DONE:
+        return JsonResponse({"message": f"export is {job.status}"}, status=409)
+
+    try:
+        return FileResponse(
+            open(job.path, "rb"),
+            as_attachment=True,
+            filename=job.filename,
+            content_type="text/csv",
+        )
+    except FileNotFoundError:
+        return JsonResponse({"message": "export expired"}, status=410)
+
+
+@staff_or_403
+def get_reqister_requests(request: HttpRequest) -> HttpResponse:
+    """Without `page` param keyset paginated by `cursor`, otherwise page param starting from 1"""
     requests = (
         CustomUser.objects.filter(approved=False, cancelled=False)
         .order_by("date_joined")
         .all()
     )
 
+    page: str | None = request.GET.get("page")
+    if page is None:
+        return cursor_page(request, requests, "date_joined", REQUESTS_PER_PAGE)
+
     paginator = Paginator(requests, REQUESTS_PER_PAGE)
 
     try:
@@ -259,3 +620,16 @@ def get_reqister_requests(request: HttpRequest) -> HttpResponse:
         },
         safe=False,
     )
+
+
+def get_metrics(request: HttpRequest) -> HttpResponse:
+    """Metrics of all workers in the Prometheus text format, for staff or
+    scrapers sending `Authorization: Bearer <METRICS_TOKEN>`."""
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get("Authorization", "")
+    if not request.user.is_staff and not (  # type: ignore
+        token and constant_time_compare(authorization, f"Bearer {token}")
+    ):
+        return unauthorized()
+
+    return HttpResponse(metrics.exposition(), content_type=CONTENT_TYPE_LATEST)
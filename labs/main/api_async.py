@@ -0,0 +1,186 @@
+"""Async variants of the read heavy endpoints of `api`, routed instead of them with `ASYNC_API`.
+
+Responses are the same. ORM and cache calls are awaited, so under ASGI a
+worker keeps serving other polling clients while a request waits for the
+database or the cache. Legacy `page` pagination is delegated to the sync views.
+"""
+import asyncio
+import hashlib
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+
+from . import api
+from .cache import (
+    FEED_CACHE_TIMEOUT,
+    FEED_VERSION_KEY,
+    TOPICS_VERSION_KEY,
+    aget_event_versions,
+    aget_version,
+)
+from .models import CustomUser, LabEvent, LabTopic
+from .utils import InvalidCursor, akeyset_page
+
+# seconds between checks of the event versions of an open seats stream
+SEATS_POLL_INTERVAL: float = 1.0
+SEATS_HEARTBEAT: float = 15.0
+# streams end after this many seconds and EventSource reconnects, so
+# streams of clients gone without notice do not live forever
+SEATS_STREAM_DURATION: float = 60.0
+
+
+async def get_user(request: HttpRequest):
+    """`request.user` loaded off the event loop, Django 4.2 has no `request.auser()`."""
+
+    def load():
+        request.user.is_authenticated  # evaluates the lazy user
+        return request.user
+
+    return await sync_to_async(load)()
+
+
+def staff_or_403(fn):
+    @wraps(fn)
+    async def wrapper(request: HttpRequest, *args, **kwargs):
+        if not (await get_user(request)).is_staff:
+            return api.unauthorized()
+        return await fn(request, *args, **kwargs)
+
+    return wrapper
+
+
+async def get_topic_catalog() -> tuple[bytes, str]:
+    """Async `api.get_topic_catalog`, shares its cache entries."""
+    key = f"topics:catalog:{await aget_version(TOPICS_VERSION_KEY)}"
+
+    if (catalog := await cache.aget(key)) is None:
+        topics = LabTopic.objects.select_related("created_by").order_by("id")
+        content = json.dumps([t.json() async for t in topics]).encode("utf-8")
+        catalog = (content, f'"{hashlib.md5(content).hexdigest()}"')
+        await cache.aset(key, catalog, api.TOPIC_CATALOG_TIMEOUT)
+
+    return catalog
+
+
+async def all_topics(request: HttpRequest):
+    if request.method != "GET":
+        return api.unauthorized()
+
+    content, etag = await get_topic_catalog()
+    response = get_conditional_response(request, etag=etag) or HttpResponse(
+        content, content_type="application/json", status=200
+    )
+    response["ETag"] = etag
+    return response
+
+
+async def keyset_content(queryset, field: str, cursor: str | None, size: int) -> dict:
+    rows, next_cursor = await akeyset_page(queryset, field, cursor, size)
+    return {
+        "content": [row.json() for row in rows],
+        "has_next": next_cursor is not None,
+        "next": next_cursor,
+    }
+
+
+async def get_feed_page(cursor: str | None, size: int) -> tuple[dict, str]:
+    """Async `api.get_feed_page`, shares its cache entries."""
+    key = f"feed:{await aget_version(FEED_VERSION_KEY)}:{size}:{cursor}"
+
+    if (content := await cache.aget(key)) is None:
+        content = await keyset_content(LabEvent.get_feed(), "lab_datetime", cursor, size)
+        await cache.aset(key, content, FEED_CACHE_TIMEOUT)
+
+    return content, key
+
+
+async def get_lab_events(request: HttpRequest):
+    """Without `page` param keyset paginated by `cursor`, otherwise page param starting from 1"""
+    user = await get_user(request)
+    if user.is_anonymous:
+        return api.unauthenticated()
+
+    if request.GET.get("page") is not None:
+        return await sync_to_async(api.get_lab_events)(request)
+
+    if (size := api.parse_page_size(request, api.EVENTS_PER_PAGE)) is None:
+        return api.invalid_page_size()
+
+    try:
+        content, key = await get_feed_page(request.GET.get("cursor"), size)
+    except InvalidCursor as e:
+        return JsonResponse({"message": str(e)}, status=400)
+
+    applied = await LabEvent.aget_applied_ids(
+        user, [event["id"] for event in content["content"]]
+    )
+    return api.feed_response(request, content, key, applied)
+
+
+async def get_my_labs(request: HttpRequest):
+    user = await get_user(request)
+    if user.is_anonymous:
+        return api.unauthenticated()
+
+    events = LabEvent.get_user_events(user)
+    return JsonResponse(
+        {"content": [event.dashboard_json() async for event in events]}, status=200
+    )
+
+
+@staff_or_403
+async def get_reqister_requests(request: HttpRequest) -> HttpResponse:
+    """Without `page` param keyset paginated by `cursor`, otherwise page param starting from 1"""
+    if request.GET.get("page") is not None:
+        return await sync_to_async(api.get_reqister_requests)(request)
+
+    if (size := api.parse_page_size(request, api.REQUESTS_PER_PAGE)) is None:
+        return api.invalid_page_size()
+
+    requests = CustomUser.objects.filter(approved=False, cancelled=False)
+    try:
+        content = await keyset_content(
+            requests, "date_joined", request.GET.get("cursor"), size
+        )
+    except InvalidCursor as e:
+        return JsonResponse({"message": str(e)}, status=400)
+
+    return JsonResponse(content, status=200)
+
+
+async def seats_stream(event_ids: list[int], last_token: str | None):
+    loop = asyncio.get_running_loop()
+    start = last_message = loop.time()
+    yield f"retry: {api.SEATS_RETRY_MS}\n\n"
+
+    while True:
+        # every stream polls the versions, cache reads only, the snapshot is
+        # loaded once per change and shared by all streams through the cache
+        versions = await aget_event_versions(event_ids)
+        if (token := api.seats_token(versions)) != last_token:
+            last_token = token
+            last_message = loop.time()
+            yield await sync_to_async(api.seats_message)(versions)
+        elif loop.time() - last_message >= SEATS_HEARTBEAT:
+            last_message = loop.time()
+            yield ": heartbeat\n\n"
+
+        if loop.time() - start >= SEATS_STREAM_DURATION:
+            return
+        await asyncio.sleep(SEATS_POLL_INTERVAL)
+
+
+async def event_seats(request: HttpRequest):
+    """Async `api.event_seats`, the stream stays open and pushes every change."""
+    if (await get_user(request)).is_anonymous:
+        return api.unauthenticated()
+    if (event_ids := api.parse_event_ids(request)) is None:
+        return api.invalid_event_ids()
+
+    return api.seats_response(
+        seats_stream(event_ids, request.headers.get("Last-Event-ID"))
+    )
@@ -0,0 +1,21 @@
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from .cache import USER_CACHE_TIMEOUT, user_cache_key
+
+
+class CachedModelBackend(ModelBackend):
+    """`ModelBackend` resolving the user of a session from the cache, so an
+    authenticated request does not query `CustomUser` before the view.
+
+    Entries are dropped by `main.signals` whenever a user is saved, deleted
+    or changed by `QuerySet.update` with `users_changed`.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        if (user := cache.get(key)) is None:
+            if (user := super().get_user(user_id)) is None:
+                return None
+            cache.set(key, user, USER_CACHE_TIMEOUT)
+        return user
@@ -0,0 +1,275 @@
+"""Bounded pool of raw DB-API connections, one per process and database alias.
+
+Django (4.2) opens a connection per request unless `CONN_MAX_AGE` keeps it,
+which ties one connection to every worker thread. With the pool, Django
+still "closes" the connection at the end of each request, but the raw
+connection goes back to the pool, so sync, threaded and async workers share
+at most `SIZE` open connections per process.
+"""
+import logging
+import os
+import threading
+import time
+import typing as t
+from collections import deque
+
+from django.db.utils import OperationalError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL = {
+    # open connections per process, checked out + idle
+    "SIZE": 5,
+    # seconds to wait for a free connection before raising `PoolTimeout`
+    "TIMEOUT": 10.0,
+    # seconds after which a connection is closed instead of reused
+    "MAX_LIFETIME": 1800.0,
+    # connections idle longer than this are pinged on checkout, 0 pings always
+    "PING_AFTER": 0.0,
+}
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class _Entry:
+    __slots__ = ("raw", "created_at", "released_at")
+
+    def __init__(self, raw, now: float):
+        self.raw = raw
+        self.created_at = now
+        self.released_at = now
+
+
+class ConnectionPool:
+    """Thread safe pool, `acquire` blocks up to `timeout` once `size`
+    connections are open. Connections are reused most recently released
+    first, so surplus idle connections age out by `max_lifetime`."""
+
+    def __init__(
+        self,
+        connect: t.Callable[[], t.Any],
+        *,
+        size: int = DEFAULT_POOL["SIZE"],
+        timeout: float = DEFAULT_POOL["TIMEOUT"],
+        max_lifetime: float = DEFAULT_POOL["MAX_LIFETIME"],
+        ping_after: float = DEFAULT_POOL["PING_AFTER"],
+        ping: t.Callable[[t.Any], bool] = lambda raw: True,
+        close: t.Callable[[t.Any], None] = lambda raw: raw.close(),
+        clock: t.Callable[[], float] = time.monotonic,
+    ):
+        if size < 1:
+            raise ValueError("pool size must be at least 1")
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self.ping = ping
+        self.close_raw = close
+        self.clock = clock
+
+        self._lock = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle: deque[_Entry] = deque()
+        self._checked_out: dict[int, _Entry] = {}
+        self._opened = 0
+        self.checkouts = 0
+        self.created = 0
+        self.discarded = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def _check_fork(self):
+        # connections inherited from the parent process are not ours to use
+        if self._pid != os.getpid():
+            self._reset()
+
+    def acquire(self):
+        """Check out a healthy connection, returns `(raw, seconds waited)`."""
+        start = self.clock()
+        with self._lock:
+            self._check_fork()
+            waited = False
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._opened < self.size:
+                    self._opened += 1
+                    entry = None
+                    break
+
+                remaining = self.timeout - (self.clock() - start)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    logger.warning(
+                        "no free connection in pool of %d after %.1f s",
+                        self.size,
+                        self.timeout,
+                    )
+                    raise PoolTimeout(
+                        f"no free database connection within {self.timeout} s"
+                    )
+                waited = True
+                self._lock.wait(remaining)
+
+            wait = self.clock() - start
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_time += wait
+                self.max_wait = max(self.max_wait, wait)
+
+        if entry is not None and not self._usable(entry):
+            self._discard(entry.raw)
+            entry = None
+
+        if entry is None:
+            try:
+                entry = _Entry(self.connect(), self.clock())
+            except BaseException:
+                with self._lock:
+                    self._opened -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self.created += 1
+
+        with self._lock:
+            self._checked_out[id(entry.raw)] = entry
+        return entry.raw, wait
+
+    def _usable(self, entry: _Entry) -> bool:
+        now = self.clock()
+        if now - entry.created_at >= self.max_lifetime:
+            return False
+        if now - entry.released_at >= self.ping_after:
+            try:
+                return self.ping(entry.raw)
+            except Exception:
+                return False
+        return True
+
+    def release(self, raw, discard: bool = False) -> None:
+        """Return a checked out connection, closing it when `discard` is set
+        or it outlived `max_lifetime`."""
+        with self._lock:
+            self._check_fork()
+            entry = self._checked_out.pop(id(raw), None)
+        if entry is None:
+            # checked out before a fork, or not from this pool
+            self.close_raw(raw)
+            return
+
+        now = self.clock()
+        if discard or now - entry.created_at >= self.max_lifetime:
+            self._discard(raw)
+            with self._lock:
+                self._opened -= 1
+                self._lock.notify()
+            return
+
+        entry.released_at = now
+        with self._lock:
+            self._idle.append(entry)
+            self._lock.notify()
+
+    def _discard(self, raw) -> None:
+        with self._lock:
+            self.discarded += 1
+        try:
+            self.close_raw(raw)
+        except Exception:
+            logger.debug("closing a discarded connection failed", exc_info=True)
+
+    def close(self) -> None:
+        """Close the idle connections, checked out ones are closed on release."""
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+            self._opened -= len(idle)
+            self._lock.notify_all()
+        for entry in idle:
+            self._discard(entry.raw)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._opened,
+                "in_use": len(self._checked_out),
+                "idle": len(self._idle),
+                "checkouts": self.checkouts,
+                "created": self.created,
+                "discarded": self.discarded,
+                "waits": self.waits,
+                "wait_time": self.wait_time,
+                "max_wait": self.max_wait,
+                "timeouts": self.timeouts,
+            }
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pools() -> dict[str, ConnectionPool]:
+    """Pools of this process by database alias."""
+    return dict(_pools)
+
+
+class PooledDatabaseWrapperMixin:
+    """Mixin for a backend `DatabaseWrapper` taking raw connections from a
+    `ConnectionPool` configured by the `POOL` key of the database settings.
+
+    Keep `CONN_MAX_AGE` at 0 so connections return to the pool after each request.
+    """
+
+    # seconds this wrapper (one per thread) waited for the pool, in total
+    pool_wait = 0.0
+
+    def get_pool(self) -> ConnectionPool:
+        with _pools_lock:
+            pool = _pools.get(self.alias)  # type: ignore
+            if pool is None:
+                options = {**DEFAULT_POOL, **self.settings_dict.get("POOL", {})}  # type: ignore
+                conn_params = self.get_connection_params()  # type: ignore
+                pool = _pools[self.alias] = ConnectionPool(  # type: ignore
+                    lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(
+                        conn_params
+                    ),
+                    size=options["SIZE"],
+                    timeout=options["TIMEOUT"],
+                    max_lifetime=options["MAX_LIFETIME"],
+                    ping_after=options["PING_AFTER"],
+                    ping=self.ping_raw,
+                )
+            return pool
+
+    def ping_raw(self, raw) -> bool:
+        raw.ping()
+        return True
+
+    def get_new_connection(self, conn_params):
+        raw, wait = self.get_pool().acquire()
+        self.pool_wait += wait
+        return raw
+
+    def _close(self):
+        if self.connection is None:  # type: ignore
+            return
+        raw = self.connection  # type: ignore
+        discard = False
+        if self.in_atomic_block or not self.autocommit:  # type: ignore
+            # do not hand out a connection with an open transaction
+            try:
+                raw.rollback()
+            except Exception:
+                discard = True
+        self.get_pool().release(raw, discard=discard)
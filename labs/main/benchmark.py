@@ -0,0 +1,464 @@
+"""Registration rush benchmark: seed students and open events, then let them
+all poll the feed and apply at the same moment.
+
+Used by the `bench_rush` management command, requests are driven either
+in-process through the WSGI handler or over HTTP against gunicorn.
+"""
+import logging
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import typing as t
+import urllib.error
+import urllib.parse
+import urllib.request
+from importlib import import_module
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.models import Session
+from django.db import connection, connections, models
+from django.db.models import QuerySet
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from . import datagen
+from .models import CustomUser, LabEvent, LinkTopicEvent, MAX_USER_APPLIES
+from .utils import keyset_page, keyset_query
+
+BENCH_EMAIL_PREFIX = "bench-"
+CSRF_SECRET = "b" * 32
+BATCH_SIZE = 1_000
+
+
+class Seed(t.NamedTuple):
+    user_ids: list[int]
+    session_keys: list[str]
+    # event id -> topic ids
+    events: dict[int, list[int]]
+
+
+class Sample(t.NamedTuple):
+    name: str
+    status: int
+    latency: float
+    queries: int | None
+
+
+def seed(
+    num_users: int,
+    num_events: int,
+    topics_per_event: int,
+    capacity: int,
+    *,
+    sessions: bool = True,
+    history: float = 0.0,
+    lead: timedelta = timedelta(days=7),
+    booked: int = 0,
+    pending: int = 0,
+) -> Seed:
+    """Events are one hour apart, the first `booked` seats of each event are
+    taken by the students and the last `pending` students wait for approval,
+    see `datagen.DataSpec` for `history` and `lead`."""
+    generated = datagen.generate(
+        datagen.DataSpec(
+            users=num_users,
+            pending=pending,
+            topics=topics_per_event,
+            events=num_events,
+            topics_per_event=topics_per_event,
+            capacity=capacity,
+            occupancy=booked / capacity if capacity else 0.0,
+            history=history,
+            spacing=timedelta(hours=1),
+            lead=lead,
+            prefix=BENCH_EMAIL_PREFIX,
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+    session_keys = []
+    if sessions:
+        users = CustomUser.objects.filter(pk__in=generated.user_ids).order_by("id")
+        session_keys = [login_session(u) for u in users.iterator()]
+    return Seed(generated.user_ids, session_keys, generated.events)
+
+
+def login_session(user: CustomUser) -> str:
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return session.session_key  # type: ignore
+
+
+def cleanup(seed: Seed | None = None) -> None:
+    if seed is not None:
+        Session.objects.filter(session_key__in=seed.session_keys).delete()
+
+    datagen.cleanup(BENCH_EMAIL_PREFIX)
+
+
+def count_overbooking(event_ids: t.Iterable[int]) -> dict[str, int]:
+    events = LabEvent.objects.filter(pk__in=event_ids)
+    overbooked = events.annotate(
+        actual=models.Count("links", filter=models.Q(links__user__isnull=False))
+    ).filter(actual__gt=models.F("capacity"))
+    over_limit = (
+        CustomUser.objects.filter(email__startswith=BENCH_EMAIL_PREFIX)
+        .annotate(
+            active=models.Count(
+                "labs", filter=models.Q(labs__event__lab_datetime__gte=timezone.now())
+            )
+        )
+        .filter(active__gt=MAX_USER_APPLIES)
+    )
+    return {
+        "overbooked_events": overbooked.count(),
+        "users_over_limit": over_limit.count(),
+        "counter_drift": LabEvent.get_counter_drift().filter(pk__in=event_ids).count(),
+    }
+
+
+class InProcessTransport:
+    """Requests through Django's WSGI handler in this process, one client per thread."""
+
+    name = "in-process"
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def client(self, session_key: str) -> Client:
+        if getattr(self.local, "session_key", None) != session_key:
+            self.local.client = Client(raise_request_exception=False)
+            self.local.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+            self.local.session_key = session_key
+        return self.local.client
+
+    def request(self, session_key: str, method: str, path: str, data=None):
+        client = self.client(session_key)
+        if method == "POST":
+            response = client.post(path, data)
+        else:
+            response = client.get(path, data)
+        return response.status_code, response.get("X-DB-Queries")
+
+    def close(self):
+        connections.close_all()
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpTransport:
+    """Requests over HTTP to a running server at `base_url`."""
+
+    name = "gunicorn"
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(NoRedirect())
+
+    def request(self, session_key: str, method: str, path: str, data=None):
+        cookie = f"{settings.SESSION_COOKIE_NAME}={session_key}; {settings.CSRF_COOKIE_NAME}={CSRF_SECRET}"
+        url = self.base_url + path
+        body = None
+        if method == "POST":
+            body = urllib.parse.urlencode(
+                {**(data or {}), "csrfmiddlewaretoken": CSRF_SECRET}
+            ).encode()
+        elif data:
+            url += "?" + urllib.parse.urlencode(data)
+
+        request = urllib.request.Request(
+            url, data=body, method=method, headers={"Cookie": cookie}
+        )
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status, response.headers.get("X-DB-Queries")
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers.get("X-DB-Queries")
+
+    def close(self):
+        pass
+
+
+def student(transport, session_key: str, seed: Seed, polls: int, rng: random.Random):
+    """One student: open home, poll the feed, then try to get a seat."""
+    samples: list[Sample] = []
+
+    def call(name: str, method: str, path: str, data=None) -> int:
+        start = time.perf_counter()
+        try:
+            status, queries = transport.request(session_key, method, path, data)
+        except Exception:
+            status, queries = 0, None
+        samples.append(
+            Sample(
+                name,
+                status,
+                time.perf_counter() - start,
+                int(queries) if queries is not None else None,
+            )
+        )
+        return status
+
+    call("home", "GET", "/")
+    for _ in range(polls):
+        call("api_events", "GET", "/api/event/all", {"size": 10})
+
+    event_ids = list(seed.events)
+    rng.shuffle(event_ids)
+    for event_id in event_ids:
+        topic_id = rng.choice(seed.events[event_id])
+        status = call(
+            "apply",
+            "POST",
+            f"/event/{event_id}?operation=apply",
+            {"topics": topic_id},
+        )
+        if status == 302:
+            break
+
+    return samples
+
+
+def run(transport, seed: Seed, concurrency: int, polls: int, rng_seed: int = 0):
+    """Start all students at once, returns the samples and the wall time."""
+    barrier = threading.Barrier(concurrency)
+    lock = threading.Lock()
+    queue = list(enumerate(seed.session_keys))
+    samples: list[Sample] = []
+
+    def worker():
+        barrier.wait()
+        try:
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    i, session_key = queue.pop()
+                result = student(
+                    transport, session_key, seed, polls, random.Random(rng_seed + i)
+                )
+                with lock:
+                    samples.extend(result)
+        finally:
+            transport.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return samples, time.perf_counter() - start
+
+
+def run_in_process(seed: Seed, concurrency: int, polls: int):
+    # 409 responses of lost claims are expected, do not log each of them
+    request_logger = logging.getLogger("django.request")
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    try:
+        with override_settings(QUERY_BUDGET_ENABLED=True):
+            return run(InProcessTransport(), seed, concurrency, polls)
+    finally:
+        request_logger.setLevel(level)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_gunicorn(seed: Seed, concurrency: int, polls: int, workers: int, threads: int):
+    port = free_port()
+    # production settings, but the benchmark does not run collectstatic
+    env = {
+        **os.environ,
+        "QUERY_BUDGET_ENABLED": "true",
+        "DEBUG": "false",
+        "STATIC_MANIFEST": "false",
+    }
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "labs.wsgi:application",
+            "-w",
+            str(workers),
+            "--threads",
+            str(threads),
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--log-level",
+            "warning",
+        ],
+        cwd=settings.BASE_DIR,
+        env=env,
+    )
+    try:
+        wait_for_port(port, server)
+        return run(HttpTransport(f"http://127.0.0.1:{port}"), seed, concurrency, polls)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def wait_for_port(port: int, server: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("gunicorn exited before accepting connections")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"gunicorn did not start listening on port {port}")
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile of sorted `values`."""
+    if not values:
+        return 0.0
+    rank = math.ceil(p / 100 * len(values))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def summarize(samples: list[Sample], wall_time: float) -> list[dict]:
+    rows = []
+    names = sorted({s.name for s in samples})
+    for name in names + ["total"]:
+        group = [s for s in samples if name in (s.name, "total")]
+        latencies = sorted(s.latency * 1000 for s in group)
+        queries = [s.queries for s in group if s.queries is not None]
+        statuses: dict[int, int] = {}
+        for s in group:
+            statuses[s.status] = statuses.get(s.status, 0) + 1
+
+        rows.append(
+            {
+                "name": name,
+                "requests": len(group),
+                "throughput": len(group) / wall_time if wall_time else 0.0,
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "queries": sum(queries) / len(queries) if queries else None,
+                "statuses": statuses,
+                "failures": sum(1 for s in group if is_failure(s.status)),
+            }
+        )
+    return rows
+
+
+def is_failure(status: int) -> bool:
+    """Server errors and requests without a response (status 0)."""
+    return status == 0 or status >= 500
+
+
+# indexes of the app's access paths, see migration 0003
+APP_INDEXES = [
+    (model, index)
+    for model in (LinkTopicEvent, LabEvent, CustomUser)
+    for index in model._meta.indexes
+]
+
+
+def analyze() -> None:
+    """Refresh the planner statistics."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "mysql":
+            tables = {model._meta.db_table for model, _ in APP_INDEXES}
+            cursor.execute(f"ANALYZE TABLE {', '.join(sorted(tables))}")
+            cursor.fetchall()
+        else:
+            cursor.execute("ANALYZE")
+
+
+def drop_app_indexes() -> None:
+    with connection.schema_editor() as editor:
+        for model, index in APP_INDEXES:
+            editor.remove_index(model, index)
+    analyze()
+
+
+def create_app_indexes() -> None:
+    with connection.schema_editor() as editor:
+        for model, index in APP_INDEXES:
+            editor.add_index(model, index)
+    analyze()
+
+
+def index_cases(seed: Seed) -> dict[str, t.Callable[[], QuerySet]]:
+    """The hot queries of the app, against an upcoming event of `seed` and
+    one of its applied students."""
+    now = timezone.now()
+    event = (
+        LabEvent.objects.filter(pk__in=seed.events, lab_datetime__gt=now, applied_count__gt=0)
+        .order_by("lab_datetime")
+        .first()
+    )
+    if event is None:
+        raise ValueError("the seed has no upcoming event with applied students")
+    link = event.links.filter(user__isnull=False).select_related("user").first()  # type: ignore
+    user = link.user
+    free_topic_id = (
+        event.links.filter(user__isnull=True).values_list("topic_id", flat=True).first()  # type: ignore
+    )
+    feed_cursor = keyset_page(LabEvent.get_feed(user), "lab_datetime", None, 10)[1]
+
+    return {
+        # `get_roster`
+        "roster": lambda: event.links.order_by("topic__title").values_list(  # type: ignore
+            "user_id", "user__fullname", "user__email", "topic_id", "topic__title"
+        ),
+        "free topics": lambda: event.get_free_topics(),
+        # link `UPDATE` of `claim_seat`
+        "free seat": lambda: LinkTopicEvent.objects.filter(
+            event=event, topic_id=free_topic_id, user__isnull=True
+        ),
+        "applied": lambda: LinkTopicEvent.objects.filter(event=event, user=user),
+        "can_apply": lambda: user.labs.filter(event__lab_datetime__gte=now),
+        "feed page 2": lambda: keyset_query(LabEvent.get_feed(user), "lab_datetime", feed_cursor)[:11],
+        "approval queue": lambda: CustomUser.objects.filter(
+            approved=False, cancelled=False
+        ).order_by("date_joined", "id")[:4],
+    }
+
+
+class Timing(t.NamedTuple):
+    name: str
+    plan: str
+    median: float
+    p95: float
+
+
+def measure(cases: dict[str, t.Callable[[], QuerySet]], repeat: int) -> list[Timing]:
+    timings = []
+    for name, query in cases.items():
+        list(query())
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(query())
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        timings.append(
+            Timing(name, query().explain(), percentile(latencies, 50), percentile(latencies, 95))
+        )
+    return timings
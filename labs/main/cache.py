@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterable
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+TOPICS_VERSION_KEY = "topics:version"
+# bumped by any change of any event, part of the keys of feed pages
+FEED_VERSION_KEY = "events:version"
+# bumped when every event has to be invalidated at once
+EVENTS_GENERATION_KEY = "events:generation"
+
+FEED_CACHE_TIMEOUT: int = 60
+EVENT_CACHE_TIMEOUT: int = 10 * 60
+
+
+def get_version(key: str) -> int:
+    """Current value of the version counter `key`, cached entries embed it in their keys."""
+    if (version := cache.get(key)) is None:
+        # start from the clock so a counter lost by eviction never repeats a
+        # version whose entries may still be cached
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(key: str) -> int:
+    """Async `get_version`."""
+    if (version := await cache.aget(key)) is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(key: str) -> None:
+    """Invalidate everything cached under the current version of `key`."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def event_version_key(event_id: int) -> str:
+    return f"event:{event_id}:version"
+
+
+def get_event_version(event_id: int) -> str:
+    return f"{get_version(EVENTS_GENERATION_KEY)}.{get_version(event_version_key(event_id))}"
+
+
+def get_event_versions(event_ids: Iterable[int]) -> dict[int, str]:
+    """`get_event_version` of many events by one `get_many`."""
+    keys = {event_version_key(event_id): event_id for event_id in event_ids}
+    found = cache.get_many([EVENTS_GENERATION_KEY, *keys])
+    generation = found.get(EVENTS_GENERATION_KEY) or get_version(EVENTS_GENERATION_KEY)
+    return {
+        event_id: f"{generation}.{found[key] if key in found else get_version(key)}"
+        for key, event_id in keys.items()
+    }
+
+
+async def aget_event_versions(event_ids: Iterable[int]) -> dict[int, str]:
+    """Async `get_event_versions`."""
+    keys = {event_version_key(event_id): event_id for event_id in event_ids}
+    found = await cache.aget_many([EVENTS_GENERATION_KEY, *keys])
+    generation = found.get(EVENTS_GENERATION_KEY) or await aget_version(
+        EVENTS_GENERATION_KEY
+    )
+    return {
+        event_id: f"{generation}.{found[key] if key in found else await aget_version(key)}"
+        for key, event_id in keys.items()
+    }
+
+
+def event_fragment_key(event_id: int, name: str, vary_on: Iterable = ()) -> str:
+    """Key of the template fragment `name` of an event under its current version."""
+    vary = hashlib.md5(":".join(str(v) for v in vary_on).encode()).hexdigest()
+    return f"event:{event_id}:fragment:{name}:{get_event_version(event_id)}:{vary}"
+
+
+# lookups of cached fragments of this process by (name, "hit" | "miss")
+fragment_stats: Counter[tuple[str, str]] = Counter()
+_fragment_stats_lock = threading.Lock()
+
+
+def record_fragment(name: str, hit: bool) -> None:
+    with _fragment_stats_lock:
+        fragment_stats[(name, "hit" if hit else "miss")] += 1
+        hits, misses = fragment_stats[(name, "hit")], fragment_stats[(name, "miss")]
+    logger.debug(
+        "fragment %s %s, hit ratio %.2f of %d",
+        name,
+        "hit" if hit else "miss",
+        hits / (hits + misses),
+        hits + misses,
+    )
+
+
+def bump_events(event_ids: Iterable[int] | None) -> None:
+    """Invalidate cached data of `event_ids`, of all events if None, and the feed."""
+    if event_ids is None:
+        bump_version(EVENTS_GENERATION_KEY)
+    else:
+        for event_id in set(event_ids):
+            bump_version(event_version_key(event_id))
+    bump_version(FEED_VERSION_KEY)
+
+
+USER_CACHE_TIMEOUT: int = 5 * 60
+
+
+def user_cache_key(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def forget_users(user_ids: Iterable[int]) -> None:
+    """Drop cached users of `main.auth.CachedModelBackend`."""
+    cache.delete_many([user_cache_key(user_id) for user_id in set(user_ids)])
@@ -0,0 +1,233 @@
+"""Synthetic data in bulk: students, topics, events and their links.
+
+Rows are inserted by `bulk_create` in batched transactions with one
+precomputed password hash, so 100k students take seconds instead of a
+PBKDF2 run each. Everything but the dates (relative to `now`) follows from
+`DataSpec.random_seed`, equal specs produce equal data.
+"""
+import itertools
+import random
+import typing as t
+from datetime import datetime, timedelta
+
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.hashers import make_password
+from django.db import models, transaction
+from django.utils import timezone
+
+from .cache import TOPICS_VERSION_KEY, bump_version
+from .models import CustomUser, ExportJob, LabEvent, LabTopic, LinkTopicEvent
+from .signals import seats_changed, users_changed
+
+PASSWORD = "heslo123"
+
+
+class DataSpec(t.NamedTuple):
+    users: int = 1_000
+    # of `users`, waiting for approval
+    pending: int = 0
+    topics: int = 50
+    events: int = 100
+    topics_per_event: int = 10
+    capacity: int = 8
+    # share of the seats of every event taken
+    occupancy: float = 0.5
+    # share of the events in the past
+    history: float = 0.5
+    # between consecutive events
+    spacing: timedelta = timedelta(hours=4)
+    # from now to the first upcoming event, registration closes 2 days before
+    lead: timedelta = timedelta(days=7)
+    prefix: str = "gen-"
+    random_seed: int = 0
+
+
+class Generated(t.NamedTuple):
+    staff_id: int
+    # students in insertion order, the pending ones last
+    user_ids: list[int]
+    # event id -> topic ids
+    events: dict[int, list[int]]
+
+
+def batched(iterable: t.Iterable, size: int) -> t.Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def bulk_insert(model: type[models.Model], objs: t.Iterable, batch_size: int) -> None:
+    """Insert `objs` in transactions of `batch_size` rows."""
+    for chunk in batched(objs, batch_size):
+        with transaction.atomic():
+            model.objects.bulk_create(chunk, batch_size=batch_size)
+
+
+def email(spec: DataSpec, i: int) -> str:
+    return f"{spec.prefix}{i}@fs.cvut.cz"
+
+
+def generate(
+    spec: DataSpec, batch_size: int = 2_000, now: datetime | None = None
+) -> Generated:
+    """Insert the data of `spec`, previous data with the same prefix is removed first."""
+    rng = random.Random(spec.random_seed)
+    now = now or timezone.now()
+    cleanup(spec.prefix)
+
+    password = make_password(PASSWORD)
+    staff = CustomUser.objects.create(
+        email=f"{spec.prefix}staff@fs.cvut.cz",
+        fullname="Generated Staff",
+        password=password,
+        is_staff=True,
+        generated=True,
+    )
+
+    approved = spec.users - spec.pending
+    bulk_insert(
+        CustomUser,
+        (
+            CustomUser(
+                email=email(spec, i),
+                fullname=f"Student {spec.prefix}{i}",
+                password=password,
+                approved=i < approved,
+                generated=True,
+                # registered over the last year, pending ones in the last week
+                date_joined=now
+                - timedelta(
+                    minutes=rng.randrange(60 * 24 * (365 if i < approved else 7))
+                ),
+            )
+            for i in range(spec.users)
+        ),
+        batch_size,
+    )
+    user_ids = list(
+        CustomUser.objects.filter(
+            generated=True, email__startswith=spec.prefix, is_staff=False
+        )
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+    bulk_insert(
+        LabTopic,
+        (
+            LabTopic(title=f"{spec.prefix}téma {i}", created_by=staff)
+            for i in range(spec.topics)
+        ),
+        batch_size,
+    )
+    topic_ids = list(
+        LabTopic.objects.filter(created_by=staff).order_by("id").values_list("id", flat=True)
+    )
+
+    past = round(spec.events * spec.history)
+
+    def lab_datetime(i: int) -> datetime:
+        if i < past:
+            return now - (past - i) * spec.spacing
+        return now + spec.lead + (i - past) * spec.spacing
+
+    bulk_insert(
+        LabEvent,
+        (
+            LabEvent(
+                lab_datetime=lab_datetime(i),
+                close_login=lab_datetime(i) - timedelta(days=2),
+                close_logout=lab_datetime(i) - timedelta(days=1),
+                capacity=spec.capacity,
+                created_by=staff,
+            )
+            for i in range(spec.events)
+        ),
+        batch_size,
+    )
+    event_ids = list(
+        LabEvent.objects.filter(created_by=staff).order_by("id").values_list("id", flat=True)
+    )
+
+    per_event = min(spec.topics_per_event, len(topic_ids))
+    events = {event_id: rng.sample(topic_ids, per_event) for event_id in event_ids}
+
+    # seats go to the approved students round robin in a shuffled order, so
+    # nobody takes two seats of one event while there are enough students
+    students = user_ids[:approved]
+    rng.shuffle(students)
+    seats = min(round(spec.capacity * spec.occupancy), per_event) if students else 0
+    taken = itertools.cycle(students)
+    bulk_insert(
+        LinkTopicEvent,
+        (
+            LinkTopicEvent(
+                event_id=event_id,
+                topic_id=topic_id,
+                user_id=next(taken) if j < seats else None,
+            )
+            for event_id, topics in events.items()
+            for j, topic_id in enumerate(topics)
+        ),
+        batch_size,
+    )
+    LabEvent.refresh_counters(event_ids)
+
+    return Generated(staff.pk, user_ids, events)  # type: ignore
+
+
+def cleanup(prefix: str) -> None:
+    """Delete the data generated with `prefix`.
+
+    Only users marked `generated` are deleted, with the topics and events of
+    the generated staff. Deleted by plain `DELETE` statements, the collector
+    of `QuerySet.delete` would load every row to send its signals, so the
+    rows referencing the users are handled here: seats of other events are
+    freed and their counters recomputed, exports and admin log entries lose
+    or drop their user. Sessions of the users resolve to anonymous users
+    until they expire. Caches are invalidated at once.
+    """
+    users = CustomUser.objects.filter(generated=True, email__startswith=prefix)
+    user_ids = list(users.values_list("id", flat=True))
+    if not user_ids:
+        return
+
+    with transaction.atomic():
+        generated_users = users.values("id")
+        events = LabEvent.objects.filter(created_by__in=generated_users).values("id")
+        topics = LabTopic.objects.filter(created_by__in=generated_users).values("id")
+        # other events keep their links but those of generated topics
+        other_links = LinkTopicEvent.objects.exclude(event__in=events)
+        touched = set(
+            other_links.filter(
+                models.Q(user__in=generated_users) | models.Q(topic__in=topics)
+            ).values_list("event_id", flat=True)
+        )
+
+        for queryset in (
+            LinkTopicEvent.objects.filter(
+                models.Q(event__in=events) | models.Q(topic__in=topics)
+            ),
+            LabEvent.objects.filter(created_by__in=generated_users),
+            LabTopic.objects.filter(created_by__in=generated_users),
+        ):
+            queryset.model.objects.filter(
+                pk__in=list(queryset.values_list("pk", flat=True))
+            )._raw_delete(queryset.db)
+        # seats of the users left on other events are freed
+        LinkTopicEvent.objects.filter(user__in=generated_users).update(
+            user=None, date=timezone.now()
+        )
+
+        for chunk in batched(user_ids, 10_000):
+            ExportJob.objects.filter(created_by__in=chunk).update(created_by=None)
+            LogEntry.objects.filter(user__in=chunk).delete()
+            CustomUser.groups.through.objects.filter(customuser__in=chunk).delete()
+            CustomUser.user_permissions.through.objects.filter(customuser__in=chunk).delete()
+            CustomUser.objects.filter(pk__in=chunk)._raw_delete(users.db)
+
+        if touched:
+            LabEvent.refresh_counters(touched)
+        seats_changed.send(sender=LabEvent, event_ids=None)
+        users_changed.send(sender=CustomUser, user_ids=user_ids)
+        transaction.on_commit(lambda: bump_version(TOPICS_VERSION_KEY))
@@ -152,6 +152,35 @@ class CreateEventForm(forms.Form):
         return cleaned
 
 
+class CreateScheduleForm(CreateEventForm):
+    """`CreateEventForm` repeated weekly, closing dates keep their offsets from the lab date."""
+
+    occurrences = forms.IntegerField(
+        initial=1, required=False, label="Počet opakování", min_value=1, max_value=52
+    )
+    interval_weeks = forms.IntegerField(
+        initial=1, required=False, label="Opakovat každý n-tý týden", min_value=1, max_value=4
+    )
+
+    def clean_occurrences(self) -> int:
+        return self.cleaned_data["occurrences"] or 1
+
+    def clean_interval_weeks(self) -> int:
+        return self.cleaned_data["interval_weeks"] or 1
+
+    def schedule(self) -> dict[str, Any]:
+        """Keyword arguments of `LabEvent.create_schedule`."""
+        return {
+            "lab_datetime": self.cleaned_data["lab_datetime"],
+            "close_login": self.cleaned_data["close_login"],
+            "close_logout": self.cleaned_data["close_logout"],
+            "capacity": self.cleaned_data["capacity"],
+            "topic_ids": [int(topic_id) for topic_id in self.cleaned_data["topics"]],
+            "occurrences": self.cleaned_data["occurrences"],
+            "interval": timezone.timedelta(weeks=self.cleaned_data["interval_weeks"]),
+        }
+
+
 class ApplyEventForm(forms.Form):
     def __init__(self, choices=list(), *args, **kwargs):
         super().__init__(*args, **kwargs)
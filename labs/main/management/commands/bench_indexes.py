@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from main import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the hot queries with and without the access path indexes "
+        "of migration 0003, printing the query plans and latencies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--events", type=int, default=10_000)
+        parser.add_argument("--topics", type=int, default=12, help="topics per event")
+        parser.add_argument("--capacity", type=int, default=8)
+        parser.add_argument("--booked", type=int, default=4, help="taken seats per event")
+        parser.add_argument("--pending", type=int, default=1_000, help="students waiting for approval")
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument(
+            "--keep", action="store_true", help="keep the seeded data afterwards"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("seeding...")
+        seed = benchmark.seed(
+            options["users"],
+            options["events"],
+            options["topics"],
+            options["capacity"],
+            sessions=False,
+            # half of the events are in the past
+            history=0.5,
+            lead=timedelta(hours=1),
+            booked=options["booked"],
+            pending=options["pending"],
+        )
+        try:
+            cases = benchmark.index_cases(seed)
+
+            benchmark.drop_app_indexes()
+            try:
+                before = benchmark.measure(cases, options["repeat"])
+            finally:
+                benchmark.create_app_indexes()
+            after = benchmark.measure(cases, options["repeat"])
+
+            self.report(before, after)
+        finally:
+            if not options["keep"]:
+                benchmark.cleanup(seed)
+
+    def report(self, before, after):
+        for old, new in zip(before, after):
+            self.stdout.write(self.style.MIGRATE_HEADING(old.name))
+            self.stdout.write("  without indexes:")
+            self.stdout.write(self.indent(old.plan))
+            self.stdout.write("  with indexes:")
+            self.stdout.write(self.indent(new.plan))
+
+        self.stdout.write(self.style.MIGRATE_HEADING("latency"))
+        self.stdout.write(
+            f"{'query':<16}{'before p50':>12}{'p95':>9}{'after p50':>12}{'p95':>9}{'speedup':>9}"
+        )
+        for old, new in zip(before, after):
+            speedup = old.median / new.median if new.median else 0.0
+            self.stdout.write(
+                f"{old.name:<16}{old.median:>10.2f}ms{old.p95:>7.2f}ms"
+                f"{new.median:>10.2f}ms{new.p95:>7.2f}ms{speedup:>8.1f}x"
+            )
+
+    @staticmethod
+    def indent(plan: str) -> str:
+        return "\n".join(f"    {line}" for line in plan.splitlines())
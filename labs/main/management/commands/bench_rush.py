@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark a registration rush: seeded students open home, poll the "
+        "event feed and apply for the same events concurrently."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--events", type=int, default=5)
+        parser.add_argument("--topics", type=int, default=12, help="topics per event")
+        parser.add_argument("--capacity", type=int, default=10)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--polls", type=int, default=3, help="feed polls per student")
+        parser.add_argument(
+            "--mode",
+            choices=["in-process", "gunicorn", "both"],
+            default="in-process",
+        )
+        parser.add_argument("--workers", type=int, default=5, help="gunicorn workers")
+        parser.add_argument("--threads", type=int, default=1, help="gunicorn threads")
+        parser.add_argument(
+            "--keep", action="store_true", help="keep the seeded data afterwards"
+        )
+
+    def handle(self, *args, **options):
+        modes = ["in-process", "gunicorn"] if options["mode"] == "both" else [options["mode"]]
+
+        failed = []
+        for mode in modes:
+            seed = benchmark.seed(
+                options["users"],
+                options["events"],
+                options["topics"],
+                options["capacity"],
+            )
+            try:
+                if mode == "in-process":
+                    samples, wall_time = benchmark.run_in_process(
+                        seed, options["concurrency"], options["polls"]
+                    )
+                else:
+                    samples, wall_time = benchmark.run_gunicorn(
+                        seed,
+                        options["concurrency"],
+                        options["polls"],
+                        options["workers"],
+                        options["threads"],
+                    )
+                if self.report(
+                    mode, samples, wall_time, benchmark.count_overbooking(seed.events)
+                ):
+                    failed.append(mode)
+            finally:
+                if not options["keep"]:
+                    benchmark.cleanup(seed)
+
+        if failed:
+            raise CommandError(f"failed requests or overbooking in: {', '.join(failed)}")
+
+    def report(
+        self, mode: str, samples, wall_time: float, overbooking: dict[str, int]
+    ) -> bool:
+        """Print the results, returns whether any request failed or a seat was overbooked."""
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{mode}: {wall_time:.2f} s"))
+        self.stdout.write(
+            f"{'endpoint':<12}{'requests':>10}{'req/s':>10}{'p50 ms':>10}"
+            f"{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'failed':>8}  statuses"
+        )
+        rows = benchmark.summarize(samples, wall_time)
+        for row in rows:
+            queries = "-" if row["queries"] is None else f"{row['queries']:.1f}"
+            statuses = ", ".join(f"{k}: {v}" for k, v in sorted(row["statuses"].items()))
+            self.stdout.write(
+                f"{row['name']:<12}{row['requests']:>10}{row['throughput']:>10.1f}"
+                f"{row['p50']:>10.1f}{row['p95']:>10.1f}{row['p99']:>10.1f}"
+                f"{queries:>9}{row['failures']:>8}  {statuses}"
+            )
+
+        failed = rows[-1]["failures"] > 0 or any(overbooking.values())
+        style = self.style.ERROR if failed else self.style.SUCCESS
+        self.stdout.write(
+            style(", ".join(f"{k.replace('_', ' ')}: {v}" for k, v in overbooking.items()))
+        )
+        return failed
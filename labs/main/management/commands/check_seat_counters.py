@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import LabEvent
+
+
+class Command(BaseCommand):
+    help = "Compare stored seat counters of events with their links and repair drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Recompute counters of events that drifted.",
+        )
+
+    def handle(self, *args, **options):
+        drifted = list(LabEvent.get_counter_drift())
+
+        for event in drifted:
+            self.stdout.write(
+                f"event {event.id}: applied {event.applied_count} (actual {event.actual_applied}), "  # type: ignore
+                f"free topics {event.free_topic_count} (actual {event.actual_free})"  # type: ignore
+            )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Seat counters are consistent."))
+            return
+
+        if not options["repair"]:
+            raise CommandError(
+                f"{len(drifted)} event(s) with drifted seat counters, run with --repair"
+            )
+
+        repaired = LabEvent.refresh_counters([event.id for event in drifted])  # type: ignore
+        self.stdout.write(self.style.SUCCESS(f"Repaired {repaired} event(s)."))
@@ -0,0 +1,75 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from main import datagen
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate reproducible synthetic students, topics, events and seats in "
+        "bulk, replacing earlier data with the same prefix."
+    )
+
+    def add_arguments(self, parser):
+        defaults = datagen.DataSpec()
+        parser.add_argument("--users", type=int, default=defaults.users)
+        parser.add_argument(
+            "--pending", type=int, default=defaults.pending, help="of users, waiting for approval"
+        )
+        parser.add_argument("--topics", type=int, default=defaults.topics)
+        parser.add_argument("--events", type=int, default=defaults.events)
+        parser.add_argument("--topics-per-event", type=int, default=defaults.topics_per_event)
+        parser.add_argument("--capacity", type=int, default=defaults.capacity)
+        parser.add_argument(
+            "--occupancy", type=float, default=defaults.occupancy, help="share of taken seats"
+        )
+        parser.add_argument(
+            "--history", type=float, default=defaults.history, help="share of past events"
+        )
+        parser.add_argument(
+            "--spacing-hours",
+            type=float,
+            default=defaults.spacing / timedelta(hours=1),
+            help="hours between consecutive events",
+        )
+        parser.add_argument("--prefix", default=defaults.prefix, help="of the generated emails")
+        parser.add_argument("--seed", type=int, default=defaults.random_seed)
+        parser.add_argument("--batch-size", type=int, default=2_000, help="rows per transaction")
+        parser.add_argument(
+            "--clean", action="store_true", help="only delete the data with the prefix"
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options["clean"]:
+            datagen.cleanup(options["prefix"])
+            self.stdout.write(
+                self.style.SUCCESS(f"deleted {options['prefix']}* in {time.perf_counter() - start:.1f} s")
+            )
+            return
+
+        spec = datagen.DataSpec(
+            users=options["users"],
+            pending=options["pending"],
+            topics=options["topics"],
+            events=options["events"],
+            topics_per_event=options["topics_per_event"],
+            capacity=options["capacity"],
+            occupancy=options["occupancy"],
+            history=options["history"],
+            spacing=timedelta(hours=options["spacing_hours"]),
+            prefix=options["prefix"],
+            random_seed=options["seed"],
+        )
+        generated = datagen.generate(spec, batch_size=options["batch_size"])
+
+        links = sum(len(topics) for topics in generated.events.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"generated {len(generated.user_ids)} students, {spec.topics} topics, "
+                f"{len(generated.events)} events with {links} topic links "
+                f"in {time.perf_counter() - start:.1f} s"
+            )
+        )
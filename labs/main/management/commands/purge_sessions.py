@@ -0,0 +1,42 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions in batches of short transactions, so the purge "
+        "does not lock the session table for logins. With --every it repeats forever."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1_000)
+        parser.add_argument(
+            "--pause", type=float, default=0.1, help="seconds to sleep between batches"
+        )
+        parser.add_argument(
+            "--every", type=float, default=0, help="repeat after this many seconds"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = self.purge(options["batch_size"], options["pause"])
+            self.stdout.write(f"deleted {deleted} expired session(s)")
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
+
+    @staticmethod
+    def purge(batch_size: int, pause: float) -> int:
+        """Delete the sessions expired by now, their `cached_db` entries expire in the cache on their own."""
+        now = timezone.now()
+        expired = Session.objects.filter(expire_date__lt=now).order_by("expire_date")
+        deleted = 0
+        while keys := list(expired.values_list("session_key", flat=True)[:batch_size]):
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            if len(keys) < batch_size:
+                break
+            time.sleep(pause)
+        return deleted
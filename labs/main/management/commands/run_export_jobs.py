@@ -0,0 +1,77 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from main import metrics
+from main.api import EXPORT_CHUNK_SIZE
+from main.models import ExportJob, ExportJobLost
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the queued CSV exports into EXPORT_ROOT and delete the ones older "
+        "than EXPORT_RETENTION. Any number of these workers may run at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="exit when the queue is empty"
+        )
+        parser.add_argument(
+            "--poll", type=float, default=2.0, help="seconds between checks of an empty queue"
+        )
+        parser.add_argument(
+            "--workers", type=int, default=1, help="jobs run at once by this process"
+        )
+
+    def handle(self, *args, **options):
+        threads = [
+            threading.Thread(
+                target=self.work, args=(options["once"], options["poll"]), daemon=True
+            )
+            for _ in range(options["workers"] - 1)
+        ]
+        for thread in threads:
+            thread.start()
+        self.work(options["once"], options["poll"])
+        for thread in threads:
+            thread.join()
+
+    def work(self, once: bool, poll: float) -> None:
+        try:
+            while True:
+                close_old_connections()
+                self.maintain()
+                if (job := ExportJob.claim_next()) is not None:
+                    self.run(job)
+                elif once:
+                    return
+                else:
+                    time.sleep(poll)
+        finally:
+            connection.close()
+
+    def maintain(self) -> None:
+        if stale := ExportJob.requeue_stale(settings.EXPORT_JOB_TIMEOUT):
+            logger.warning("found %d export job(s) without a heartbeat", stale)
+        if purged := ExportJob.purge(settings.EXPORT_RETENTION):
+            self.stdout.write(f"deleted {purged} expired export(s)")
+
+    def run(self, job: ExportJob) -> None:
+        try:
+            with metrics.EXPORT_DURATION.labels(job.kind).time():
+                job.run(EXPORT_CHUNK_SIZE)
+        except ExportJobLost:
+            logger.warning("export job %d was taken over by another worker", job.pk)
+            return
+        except Exception as e:
+            logger.exception("export job %d failed", job.pk)
+            job.fail(f"{type(e).__name__}: {e}")
+            return
+        self.stdout.write(f"export job {job.pk} wrote {job.rows} row(s) to {job.path}")
@@ -0,0 +1,58 @@
+"""Prometheus metrics of the app, served by `api.get_metrics`.
+
+With `METRICS_ENABLED` every gunicorn worker writes its values to its own
+mmap'd files in `PROMETHEUS_MULTIPROC_DIR` (set by the settings before
+`prometheus_client` is imported) and a scrape of any worker sums the files
+of all of them. The directory must be emptied when the server starts,
+`entrypoint.sh` does. Only counters and histograms are used, their values
+stay valid after a worker exits.
+"""
+import os
+import time
+import typing as t
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+REQUEST_DURATION = Histogram(
+    "labs_request_duration_seconds",
+    "Request latency by URL name",
+    ["view", "method"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+RESPONSES = Counter(
+    "labs_responses_total", "Responses by URL name and status", ["view", "status"]
+)
+DB_QUERIES = Counter("labs_db_queries_total", "Database queries by URL name", ["view"])
+DB_TIME = Counter(
+    "labs_db_seconds_total", "Time spent in database queries by URL name", ["view"]
+)
+SEAT_CLAIMS = Counter("labs_seat_claims_total", "Seat claims by result", ["result"])
+EXPORT_DURATION = Histogram(
+    "labs_export_duration_seconds",
+    "Time to stream a CSV export",
+    ["export"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+
+def timed(chunks: t.Iterable, histogram) -> t.Iterator:
+    """Yield `chunks` and observe the time until they are exhausted."""
+    start = time.perf_counter()
+    yield from chunks
+    histogram.observe(time.perf_counter() - start)
+
+
+def exposition() -> bytes:
+    """Metrics in the Prometheus text format, of all workers in multiprocess mode."""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
@@ -0,0 +1,291 @@
+import gzip
+import logging
+import re
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+import brotli
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from . import metrics
+from .backends.pool import PooledDatabaseWrapperMixin
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """`execute_wrapper` counting executed queries and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+    @staticmethod
+    def pool_wait() -> float | None:
+        """Seconds this thread waited for pooled connections so far, None without a pool."""
+        waits = [
+            connection.pool_wait
+            for connection in connections.all()
+            if isinstance(connection, PooledDatabaseWrapperMixin)
+        ]
+        return sum(waits) if waits else None
+
+    def record(self):
+        """Context manager installing the recorder on every database connection."""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+    @contextmanager
+    def record_async(self):
+        """Record the queries of the current async request.
+
+        Its ORM calls run in `sync_to_async` threads with connections of their
+        own, which `dispatch_async` (installed on every connection) routes to
+        the recorder of the context they were called from.
+        """
+        token = _async_recorder.set(self)
+        try:
+            yield self
+        finally:
+            _async_recorder.reset(token)
+
+    @staticmethod
+    def dispatch_async(execute, sql, params, many, context):
+        if (recorder := _async_recorder.get()) is None:
+            return execute(sql, params, many, context)
+        return recorder(execute, sql, params, many, context)
+
+
+_async_recorder: ContextVar[QueryRecorder | None] = ContextVar("async_recorder", default=None)
+
+
+def get_url_name(request: HttpRequest) -> str:
+    match = request.resolver_match
+    if match is None or match.url_name is None:
+        return "-"
+    return match.url_name
+
+
+class QueryBudgetMiddleware:
+    """Count queries and DB time of each request and compare them to the budget of its URL name.
+
+    Enabled by `QUERY_BUDGET_ENABLED`, budgets are taken from `QUERY_BUDGETS`
+    and `QUERY_BUDGET_DEFAULT` applies to URL names missing there. With the
+    pooled backend the time spent waiting for a connection is reported too.
+    Queries a streaming response runs while its content is consumed are not
+    counted. Async capable, under ASGI the queries of async views are recorded
+    by `QueryRecorder.record_async` and the pool wait is not reported.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_BUDGET_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        pool_wait = recorder.pool_wait()
+        with recorder.record():
+            response = self.get_response(request)
+        if pool_wait is not None:
+            pool_wait = recorder.pool_wait() - pool_wait  # type: ignore
+        return self.check(request, response, recorder, pool_wait)
+
+    async def __acall__(self, request: HttpRequest):
+        recorder = QueryRecorder()
+        with recorder.record_async():
+            response = await self.get_response(request)
+        # the connections of `sync_to_async` threads wait for the pool, not this one
+        return self.check(request, response, recorder, None)
+
+    @staticmethod
+    def check(
+        request: HttpRequest,
+        response: HttpResponse,
+        recorder: QueryRecorder,
+        pool_wait: float | None,
+    ) -> HttpResponse:
+        url_name = get_url_name(request)
+        budget = settings.QUERY_BUDGETS.get(url_name, settings.QUERY_BUDGET_DEFAULT)
+        duration_ms = recorder.duration * 1000
+
+        response["X-DB-Queries"] = str(recorder.count)
+        response["X-DB-Time"] = f"{duration_ms:.1f}"
+        if pool_wait is not None:
+            response["X-DB-Pool-Wait"] = f"{pool_wait * 1000:.1f}"
+
+        if recorder.count > budget:
+            response["X-Query-Budget-Exceeded"] = f"{recorder.count}/{budget}"
+            logger.warning(
+                "%s exceeded query budget: %d queries (budget %d), %.1f ms",
+                url_name,
+                recorder.count,
+                budget,
+                duration_ms,
+            )
+        else:
+            logger.debug(
+                "%s: %d queries, %.1f ms", url_name, recorder.count, duration_ms
+            )
+
+        return response
+
+
+# brotli quality for responses compressed on the fly, 11 is for static files
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+# streaming responses are compressed in blocks of at least this many bytes,
+# the CSV exports stream one short row at a time
+COMPRESS_BLOCK_SIZE = 64 * 1024
+
+
+def accepted_encoding(request: HttpRequest) -> str | None:
+    """`br` or `gzip` if accepted by the client, brotli preferred."""
+    accepted = set()
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not re.fullmatch(r"\s*q\s*=\s*0(\.0*)?\s*", params):
+            accepted.add(coding.strip().lower())
+    for encoding in ("br", "gzip"):
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def compress(encoding: str, content: bytes) -> bytes:
+    if encoding == "br":
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(encoding: str, chunks):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)  # noqa: E731
+
+    block = []
+    size = 0
+    for chunk in chunks:
+        block.append(chunk)
+        size += len(chunk)
+        if size >= COMPRESS_BLOCK_SIZE:
+            yield process(b"".join(block)) + flush()
+            block, size = [], 0
+    yield process(b"".join(block)) + finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress responses of `COMPRESS_CONTENT_TYPES` by brotli or gzip, as the client accepts.
+
+    Responses shorter than `COMPRESS_MIN_SIZE` bytes are sent as they are,
+    sync streaming responses (CSV exports) are always compressed. Unlike
+    Django's `GZipMiddleware`, HTML is left alone, pages carry CSRF tokens (BREACH).
+    """
+
+    def process_response(self, request: HttpRequest, response: HttpResponse):
+        content_type = response.get("Content-Type", "").partition(";")[0].strip()
+        if (
+            content_type not in settings.COMPRESS_CONTENT_TYPES
+            or response.has_header("Content-Encoding")
+            or (response.streaming and response.is_async)  # type: ignore
+        ):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if (encoding := accepted_encoding(request)) is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(encoding, response.streaming_content)  # type: ignore
+            del response["Content-Length"]
+        else:
+            if len(response.content) < settings.COMPRESS_MIN_SIZE:
+                return response
+            compressed = compress(encoding, response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+
+        # the compressed body is not byte equal to the validated one
+        if (etag := response.get("ETag", "")).startswith('"'):
+            response["ETag"] = f"W/{etag}"
+        response["Content-Encoding"] = encoding
+        return response
+
+
+class MetricsMiddleware:
+    """Record latency, status and database queries of each request by URL name in `main.metrics`.
+
+    Enabled by `METRICS_ENABLED`. Static files are served before it and not
+    recorded. Async capable, so async views stay on the event loop under ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with recorder.record():
+            response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - start, recorder)
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with recorder.record_async():
+            response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - start, recorder)
+        return response
+
+    @staticmethod
+    def observe(
+        request: HttpRequest, response: HttpResponse, duration: float, recorder: QueryRecorder
+    ) -> None:
+        view = get_url_name(request)
+        metrics.REQUEST_DURATION.labels(view, request.method).observe(duration)
+        metrics.RESPONSES.labels(view, str(response.status_code)).inc()
+        metrics.DB_QUERIES.labels(view).inc(recorder.count)
+        metrics.DB_TIME.labels(view).inc(recorder.duration)
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.5 on 2026-10-18 02:11
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_links(LinkTopicEvent, user__isnull: bool):
+    return Coalesce(
+        models.Subquery(
+            LinkTopicEvent.objects.filter(
+                event=models.OuterRef("pk"), user__isnull=user__isnull
+            )
+            .order_by()
+            .values("event")
+            .annotate(count=models.Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    LabEvent = apps.get_model("main", "LabEvent")
+    LinkTopicEvent = apps.get_model("main", "LinkTopicEvent")
+
+    LabEvent.objects.update(
+        applied_count=count_links(LinkTopicEvent, user__isnull=False),
+        free_topic_count=count_links(LinkTopicEvent, user__isnull=True),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="labevent",
+            name="applied_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="labevent",
+            name="free_topic_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
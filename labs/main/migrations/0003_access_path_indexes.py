@@ -0,0 +1,36 @@
+# Generated by Django 4.2.5 on 2026-10-18 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0002_lab_event_seat_counters"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="customuser",
+            index=models.Index(
+                fields=["approved", "cancelled", "date_joined", "id"],
+                name="user_approval_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="labevent",
+            index=models.Index(fields=["lab_datetime", "id"], name="event_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="linktopicevent",
+            index=models.Index(fields=["user", "event"], name="link_user_event_idx"),
+        ),
+        # skipped on MySQL, which has no partial indexes
+        migrations.AddIndex(
+            model_name="linktopicevent",
+            index=models.Index(
+                condition=models.Q(("user__isnull", True)),
+                fields=["event", "topic"],
+                name="link_free_seat_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-18 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0003_access_path_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="generated",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
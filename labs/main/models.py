@@ -1,5 +1,11 @@
-from collections.abc import Iterable
-from django.db import models
+import csv
+import enum
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser, BaseUserManager, AbstractBaseUser
 from django.core.exceptions import ValidationError
 from django.core.validators import (
@@ -9,9 +15,13 @@ from django.core.validators import (
 )
 from .forms import cvut_email
 
+from django.urls import reverse
 from django.utils import timezone
 import typing as t
-from .utils import repr_format, official_format
+from .utils import repr_format, official_format, Echo, iterate_in_chunks
+from .cache import EVENT_CACHE_TIMEOUT, get_event_version, get_event_versions
+from .signals import seats_changed, users_changed
+from django.core.cache import cache
 
 MAX_USER_APPLIES: int = 3
 
@@ -21,6 +31,46 @@ def more_than_one_word(value: str):
         raise ValidationError("Téma musí obsahovat alespoň jedno slovo", code="invalid")
 
 
+class SeatClaim(enum.Enum):
+    CLAIMED = "claimed"
+    CLOSED = "closed"
+    ALREADY_APPLIED = "already_applied"
+    FULL = "full"
+    LIMIT_REACHED = "limit_reached"
+    TAKEN = "taken"
+
+
+class RosterTopic(t.NamedTuple):
+    id: int
+    title: str
+
+
+class RosterEntry(t.NamedTuple):
+    """An applied student as shown on the event page, cached without the user row."""
+
+    user_id: int
+    fullname: str
+    email: str
+    topic: RosterTopic
+
+
+class EventRoster(t.NamedTuple):
+    applied: list[RosterEntry]
+    free_topics: list[tuple[int, str]]
+    user_topic: RosterTopic | None
+
+
+class ExportKind(models.TextChoices):
+    CLOSED = "closed", "Následující hodiny s uzavřeným odhlášením"
+    HISTORY = "history", "Historie cvičení"
+
+    def window(self, now: datetime) -> tuple[datetime, datetime]:
+        """Start and end of the export made at `now`, see `LinkTopicEvent.get_export`."""
+        if self == ExportKind.CLOSED:
+            return now - timedelta(days=1), now
+        return now - timedelta(weeks=30), now
+
+
 # Create your models here.
 class LabTopic(models.Model):
     title = models.CharField(
@@ -33,6 +83,14 @@ class LabTopic(models.Model):
     def json(self):
         return {"id": self.id, "title": self.title, "created_by": self.created_by.email}  # type: ignore
 
+    def delete(self, *args, **kwargs):
+        # links of the topic are deleted by cascade, events lose those seats
+        with transaction.atomic():
+            event_ids = list(self.links.values_list("event_id", flat=True))  # type: ignore
+            result = super().delete(*args, **kwargs)
+            LabEvent.refresh_counters(event_ids)
+        return result
+
 
 class LabEvent(models.Model):
     lab_datetime = models.DateTimeField(null=False)
@@ -52,6 +110,17 @@ class LabEvent(models.Model):
         null=True,
     )
 
+    # denormalized from `links`, every path changing `LinkTopicEvent.user`
+    # updates them in the same transaction, `check_seat_counters` repairs drift
+    applied_count = models.PositiveIntegerField(default=0)
+    free_topic_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # feed, ordered and keyset paginated by `(lab_datetime, id)`
+            models.Index(fields=["lab_datetime", "id"], name="event_date_idx"),
+        ]
+
     def _get_applied_users_query(self):
         # return LinkTopicEvent.objects.filter(~models.Q(user=None), event=self)
 
@@ -61,9 +130,14 @@ class LabEvent(models.Model):
         return self._get_applied_users_query().all()
 
     def get_number_applied_users(self) -> int:
-        return self._get_applied_users_query().count()
+        return self.applied_count
+
+    def get_number_topics(self) -> int:
+        return self.applied_count + self.free_topic_count
 
     def get_free_topics(self):
+        if self.free_topic_count == 0:
+            return LabTopic.objects.none()
         return LabTopic.objects.filter(links__user=None, links__event=self).all()
 
     def get_free_topics_radios(self) -> list[tuple[int, str]]:
@@ -72,10 +146,201 @@ class LabEvent(models.Model):
     def get_user_topic(self, user) -> LabTopic | None:
         return LabTopic.objects.filter(links__user=user, links__event=self).first()
 
+    def get_roster(self, user) -> EventRoster:
+        """Applied students, free topics and the topic of `user`.
+
+        Only the shown values are fetched, by a single query, and cached until
+        a seat of the event changes.
+        """
+        key = f"event:{self.pk}:roster_values:{get_event_version(self.pk)}"
+
+        if (cached := cache.get(key)) is None:
+            applied, free_topics = [], []
+            rows = self.links.order_by("topic__title").values_list(  # type: ignore
+                "user_id", "user__fullname", "user__email", "topic_id", "topic__title"
+            )
+            for user_id, fullname, email, topic_id, title in rows:
+                if user_id is None:
+                    free_topics.append((topic_id, title))
+                else:
+                    applied.append(
+                        RosterEntry(user_id, fullname, email, RosterTopic(topic_id, title))
+                    )
+            cached = (applied, free_topics)
+            cache.set(key, cached, EVENT_CACHE_TIMEOUT)
+
+        applied, free_topics = cached
+        user_topic = next(
+            (entry.topic for entry in applied if entry.user_id == user.pk), None
+        )
+        return EventRoster(applied, free_topics, user_topic)
+
     def is_full(self) -> bool:
-        return self.capacity == self.get_number_applied_users()
+        return self.applied_count >= self.capacity
 
-    def save(self, *args, **kwargs) -> None:
+    @classmethod
+    def get_seats(
+        cls, event_ids: Iterable[int], versions: dict[int, str] | None = None
+    ) -> list[dict]:
+        """Seat availability of `event_ids`, cached until a seat of the event changes.
+
+        `versions` are the current event versions when the caller already has
+        them. Missing events are left out.
+        """
+        if versions is None:
+            versions = get_event_versions(event_ids)
+        keys = {f"event:{pk}:seats:{version}": pk for pk, version in versions.items()}
+        seats = {keys[key]: value for key, value in cache.get_many(keys).items()}
+
+        if missing := [pk for pk in versions if pk not in seats]:
+            free_topics: dict[int, list[int]] = {pk: [] for pk in missing}
+            for event_id, topic_id in (
+                LinkTopicEvent.objects.filter(event_id__in=missing, user__isnull=True)
+                .order_by("topic_id")
+                .values_list("event_id", "topic_id")
+            ):
+                free_topics[event_id].append(topic_id)
+
+            loaded = {
+                event.pk: event.seats_json(free_topics[event.pk])
+                for event in cls.objects.filter(pk__in=missing)
+            }
+            cache.set_many(
+                {f"event:{pk}:seats:{versions[pk]}": value for pk, value in loaded.items()},
+                EVENT_CACHE_TIMEOUT,
+            )
+            seats.update(loaded)
+
+        return [seats[pk] for pk in versions if pk in seats]
+
+    def seats_json(self, free_topics: list[int]) -> dict:
+        return {
+            "id": self.pk,
+            "applied": self.applied_count,
+            "capacity": self.capacity,
+            "full": self.is_full(),
+            "free_topics": free_topics,
+        }
+
+    def claim_seat(self, user: "CustomUser", topic_id: int) -> SeatClaim:
+        """Apply `user` for `topic_id` of this event.
+
+        Capacity is reserved first by a conditional
+        `UPDATE ... SET applied_count = applied_count + 1 WHERE applied_count < capacity`,
+        which locks the event row until commit (on SQLite the first write
+        takes the database lock, so no transaction has to upgrade a read
+        lock). It also requires a free topic, an event that lost topics runs
+        out of them before its capacity and reports FULL then. The user row
+        is locked next so claims by the same user are serialized for the
+        per-user limit, and the seat itself is taken by
+        `UPDATE ... WHERE user_id IS NULL`. A claim failing any step rolls
+        back and writes nothing.
+        """
+        if self.close_login < timezone.now():
+            return SeatClaim.CLOSED
+
+        with transaction.atomic():
+            if not LabEvent.objects.filter(
+                pk=self.pk,
+                applied_count__lt=models.F("capacity"),
+                free_topic_count__gt=0,
+            ).update(
+                applied_count=models.F("applied_count") + 1,
+                free_topic_count=models.F("free_topic_count") - 1,
+            ):
+                result = SeatClaim.FULL
+            else:
+                list(CustomUser.objects.select_for_update().filter(pk=user.pk).values("pk"))
+
+                # the event is upcoming while registration is open
+                active = user.get_active_event_ids()
+                if self.pk in active:
+                    result = SeatClaim.ALREADY_APPLIED
+                elif len(active) >= MAX_USER_APPLIES:
+                    result = SeatClaim.LIMIT_REACHED
+                elif not LinkTopicEvent.objects.filter(
+                    event=self, topic_id=topic_id, user=None
+                ).update(user=user, date=timezone.now()):
+                    result = SeatClaim.TAKEN
+                else:
+                    seats_changed.send(sender=LabEvent, event_ids=[self.pk])
+                    return SeatClaim.CLAIMED
+
+                transaction.set_rollback(True)
+
+        self.refresh_from_db(fields=["applied_count", "free_topic_count"])
+        if result == SeatClaim.FULL and self.links.filter(user=user).exists():  # type: ignore
+            return SeatClaim.ALREADY_APPLIED
+        return result
+
+    def release_seat(self, user: "CustomUser") -> bool:
+        """Log `user` out of this event, returns whether the user was applied.
+
+        Like `claim_seat` the event row is written first, keeping the lock
+        order event -> links for both paths.
+        """
+        with transaction.atomic():
+            if not LabEvent.objects.filter(
+                models.Exists(
+                    LinkTopicEvent.objects.filter(event=models.OuterRef("pk"), user=user)
+                ),
+                pk=self.pk,
+            ).update(
+                applied_count=models.F("applied_count") - 1,
+                free_topic_count=models.F("free_topic_count") + 1,
+            ):
+                return False
+
+            released = LinkTopicEvent.objects.filter(event=self, user=user).update(
+                user=None, date=timezone.now()
+            )
+            if released != 1:
+                LabEvent.refresh_counters([self.pk])
+            seats_changed.send(sender=LabEvent, event_ids=[self.pk])
+
+        return True
+
+    @staticmethod
+    def _count_links(user__isnull: bool):
+        return Coalesce(
+            models.Subquery(
+                LinkTopicEvent.objects.filter(
+                    event=models.OuterRef("pk"), user__isnull=user__isnull
+                )
+                .order_by()
+                .values("event")
+                .annotate(count=models.Count("pk"))
+                .values("count")
+            ),
+            0,
+        )
+
+    @classmethod
+    def refresh_counters(cls, event_ids: Iterable[int] | None = None) -> int:
+        """Recompute `applied_count` and `free_topic_count` from the links, all events if `event_ids` is None."""
+        if event_ids is not None:
+            event_ids = list(event_ids)
+
+        events = cls.objects.all() if event_ids is None else cls.objects.filter(pk__in=event_ids)
+        updated = events.update(
+            applied_count=cls._count_links(user__isnull=False),
+            free_topic_count=cls._count_links(user__isnull=True),
+        )
+        seats_changed.send(sender=cls, event_ids=event_ids)
+        return updated
+
+    @classmethod
+    def get_counter_drift(cls):
+        """Events whose stored counters do not match their links."""
+        return cls.objects.annotate(
+            actual_applied=cls._count_links(user__isnull=False),
+            actual_free=cls._count_links(user__isnull=True),
+        ).filter(
+            ~models.Q(applied_count=models.F("actual_applied"))
+            | ~models.Q(free_topic_count=models.F("actual_free"))
+        )
+
+    def validate_dates(self) -> None:
         # if self.lab_datetime < timezone.now():
         #     raise ValidationError("Date of Lab cannot be in the past", code="invalid")
 
@@ -96,27 +361,156 @@ class LabEvent(models.Model):
                 code="invalid",
             )
 
+    def save(self, *args, **kwargs) -> None:
+        self.validate_dates()
         super().save(*args, **kwargs)
 
+    @classmethod
+    def create_schedule(
+        cls,
+        *,
+        lab_datetime: datetime,
+        close_login: datetime,
+        close_logout: datetime,
+        capacity: int,
+        topic_ids: list[int],
+        created_by: "CustomUser",
+        occurrences: int = 1,
+        interval: timedelta = timedelta(weeks=1),
+    ) -> list["LabEvent"]:
+        """Create `occurrences` events `interval` apart, all with `topic_ids`.
+
+        Closing dates keep their offsets from the first lab date. Every event
+        is validated like by `save`, then all events and their links are
+        inserted by two `bulk_create` in one transaction.
+        """
+        topic_ids = list(dict.fromkeys(topic_ids))
+        events = [
+            cls(
+                lab_datetime=lab_datetime + i * interval,
+                close_login=close_login + i * interval,
+                close_logout=close_logout + i * interval,
+                capacity=capacity,
+                created_by=created_by,
+                free_topic_count=len(topic_ids),
+            )
+            for i in range(occurrences)
+        ]
+        for event in events:
+            event.validate_dates()
+
+        with transaction.atomic():
+            events = cls.objects.bulk_create(events)
+            if not connection.features.can_return_rows_from_bulk_insert:
+                events = cls._fetch_created(events)
+
+            LinkTopicEvent.objects.bulk_create(
+                LinkTopicEvent(event=event, topic_id=topic_id)
+                for event in events
+                for topic_id in topic_ids
+            )
+            # `bulk_create` sends no model signals
+            seats_changed.send(cls, event_ids=[event.pk for event in events])
+
+        return events
+
+    @classmethod
+    def _fetch_created(cls, events: list["LabEvent"]) -> list["LabEvent"]:
+        # MySQL does not return the ids of bulk inserted rows, the newest
+        # events of the creator at those dates are the ones just inserted
+        by_date = {}
+        for event in cls.objects.filter(
+            created_by=events[0].created_by,
+            lab_datetime__in=[event.lab_datetime for event in events],
+        ).order_by("lab_datetime", "-id"):
+            by_date.setdefault(event.lab_datetime, event)
+        return [by_date[event.lab_datetime] for event in events]
+
     @classmethod
     def get_user_events(cls, user: "CustomUser"):
+        """Upcoming events of `user` with the user's topic as `user_topic_id` and
+        `user_topic_title`, one query, counts are read from the stored counters."""
         return (
             cls.objects.filter(links__user=user, lab_datetime__gte=timezone.now())
+            # the link joined by the filter above, the user's one
+            .annotate(
+                user_topic_id=models.F("links__topic_id"),
+                user_topic_title=models.F("links__topic__title"),
+            )
             .order_by("lab_datetime")
-            .all()
         )
 
-    def json(self, user: AbstractBaseUser):
-        applied = self.links.filter(user=user).first() is not None  # type: ignore
+    @classmethod
+    def get_feed(cls, user: AbstractBaseUser | None = None):
+        """Upcoming events with topics, ordered by date.
+
+        Counts are read from the stored counters, with `user` the "applied"
+        flag is annotated by an `EXISTS` subquery, so a page of the feed is one
+        query no matter how many events it holds.
+        """
+        events = cls.objects.filter(lab_datetime__gt=timezone.now())
+        if user is not None:
+            events = events.annotate(
+                applied=models.Exists(
+                    LinkTopicEvent.objects.filter(
+                        event=models.OuterRef("pk"), user=user
+                    )
+                ),
+            )
+
+        return (
+            events.alias(
+                num_topics=models.F("applied_count") + models.F("free_topic_count")
+            )
+            .filter(num_topics__gte=1)
+            .order_by("lab_datetime")
+        )
+
+    @staticmethod
+    def get_applied_ids(user: AbstractBaseUser, event_ids: list[int]) -> set[int]:
+        """Which of `event_ids` the user is applied for."""
+        return set(
+            LinkTopicEvent.objects.filter(user=user, event_id__in=event_ids).values_list(
+                "event_id", flat=True
+            )
+        )
+
+    @staticmethod
+    async def aget_applied_ids(user: AbstractBaseUser, event_ids: list[int]) -> set[int]:
+        """Async `get_applied_ids`."""
+        return {
+            event_id
+            async for event_id in LinkTopicEvent.objects.filter(
+                user=user, event_id__in=event_ids
+            ).values_list("event_id", flat=True)
+        }
+
+    def dashboard_json(self):
+        """Serialize an event obtained from `get_user_events`."""
+        return {
+            "id": self.id,  # type: ignore
+            "lab_date": repr_format(self.lab_datetime),
+            "close_login": repr_format(self.close_login),
+            "close_logout": repr_format(self.close_logout),
+            "capacity": self.capacity,
+            "num_topics": self.get_number_topics(),
+            "num_users": self.applied_count,
+            "full": self.is_full(),
+            "topic": {"id": self.user_topic_id, "title": self.user_topic_title},  # type: ignore
+            "can_logout": self.close_logout >= timezone.now(),
+        }
+
+    def json(self):
+        """Serialize an event obtained from `get_feed`."""
         return {
             "id": self.id,  # type: ignore
             "lab_date": repr_format(self.lab_datetime),
             "close_login": repr_format(self.close_login),
             "close_logout": repr_format(self.close_logout),
             "capacity": self.capacity,
-            "num_topics": self.topics.count(),
-            "num_users": self.get_number_applied_users(),
-            "applied": applied,
+            "num_topics": self.get_number_topics(),
+            "num_users": self.applied_count,
+            "applied": getattr(self, "applied", False),
             "full": self.is_full(),
         }
 
@@ -142,12 +536,33 @@ class LinkTopicEvent(models.Model):
                 fields=["event", "topic", "user"], name="unique link"
             )
         ]
+        # roster and "is the user applied" lookups by event are served by the
+        # unique constraint, which leads with `event`
+        indexes = [
+            # `can_apply`, user -> events joined on `lab_datetime`
+            models.Index(fields=["user", "event"], name="link_user_event_idx"),
+            # free seats of an event, partial where the backend supports it
+            models.Index(
+                fields=["event", "topic"],
+                condition=models.Q(user__isnull=True),
+                name="link_free_seat_idx",
+            ),
+        ]
+
+    CSV_HEADER = (
+        "datum a čas hodiny",
+        "uzávěr přihlášení",
+        "uzávěr odhlášení",
+        "téma",
+        "jméno studenta",
+        "email studenta",
+    )
 
     @staticmethod
     def get_csv_header() -> str:
-        return "datum a čas hodiny;uzávěr přihlášení;uzávěr odhlášení;téma;jméno studenta;email studenta"
+        return ";".join(LinkTopicEvent.CSV_HEADER)
 
-    def to_csv_line(self) -> str:
+    def to_csv_row(self) -> list[str]:
         if self.user:
             fullname = self.user.fullname
             email = self.user.email
@@ -155,14 +570,39 @@ class LinkTopicEvent(models.Model):
             fullname = ""
             email = ""
 
-        return f"{official_format(self.event.lab_datetime)};{official_format(self.event.close_login)};{official_format(self.event.close_logout)};{self.topic.title};{fullname};{email}"
+        return [
+            official_format(self.event.lab_datetime),
+            official_format(self.event.close_login),
+            official_format(self.event.close_logout),
+            self.topic.title,
+            fullname,
+            email,
+        ]
+
+    def to_csv_line(self) -> str:
+        return ";".join(self.to_csv_row())
+
+    @staticmethod
+    def iter_csv(links: t.Iterable["LinkTopicEvent"]) -> Iterator[str]:
+        """Yield the export one encoded line at a time, values containing `;` are quoted."""
+        writer = csv.writer(Echo(), delimiter=";", lineterminator="\n")
+        yield writer.writerow(LinkTopicEvent.CSV_HEADER)
+        for link in links:
+            yield writer.writerow(link.to_csv_row())
 
     @staticmethod
     def links_to_csv(links: t.Iterable["LinkTopicEvent"]) -> str:
-        return (
-            LinkTopicEvent.get_csv_header()
-            + "\n"
-            + "\n".join(map(lambda l: l.to_csv_line(), links))
+        return "".join(LinkTopicEvent.iter_csv(links))
+
+    @staticmethod
+    def get_export(kind: "ExportKind", start: datetime, end: datetime):
+        """Links exported as `kind` between `start` and `end` of `ExportKind.window`."""
+        if kind == ExportKind.CLOSED:
+            return LinkTopicEvent.objects.filter(
+                event__lab_datetime__gte=start, event__close_logout__lte=end
+            )
+        return LinkTopicEvent.objects.filter(
+            event__lab_datetime__lte=end, event__lab_datetime__gte=start
         )
 
 
@@ -200,6 +640,29 @@ class UserManager(BaseUserManager):
         return self._create_user(email, password, **extra_fields)
 
 
+class RequestAction(enum.Enum):
+    """Transitions of registration requests, `condition` selects the users an action applies to."""
+
+    APPROVE = "approve"
+    DECLINE = "decline"
+
+    @property
+    def condition(self) -> models.Q:
+        if self == RequestAction.APPROVE:
+            return models.Q(approved=False, cancelled=False)
+        return models.Q(cancelled=False)
+
+    @property
+    def changes(self) -> dict[str, bool]:
+        if self == RequestAction.APPROVE:
+            return {"approved": True}
+        return {"cancelled": True}
+
+    @property
+    def outcome(self) -> str:
+        return "approved" if self == RequestAction.APPROVE else "declined"
+
+
 class CustomUser(AbstractUser):
     id = models.BigAutoField(primary_key=True)
     username = None
@@ -214,12 +677,23 @@ class CustomUser(AbstractUser):
     fullname = models.CharField(max_length=55)
     approved = models.BooleanField(default=True)
     cancelled = models.BooleanField(default=False)
+    # inserted by `datagen`, only these are removed by `datagen.cleanup`
+    generated = models.BooleanField(default=False, editable=False)
     # student_id = models.CharField(null=False, max_length=10)
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # approval queue, keyset paginated by `(date_joined, id)`
+            models.Index(
+                fields=["approved", "cancelled", "date_joined", "id"],
+                name="user_approval_idx",
+            ),
+        ]
+
     def json(self):
         return {
             "id": self.id,
@@ -228,11 +702,269 @@ class CustomUser(AbstractUser):
             "date_joined": repr_format(self.date_joined),
         }
 
+    @classmethod
+    def resolve_requests(
+        cls,
+        action: RequestAction,
+        ids: list[int] | None = None,
+        pending: models.Q | None = None,
+    ) -> dict[int, str]:
+        """Apply `action` to users `ids`, or to all pending requests matching
+        `pending`, by one conditional `UPDATE`.
+
+        Returns the outcome per id: `approved`/`declined`, `unchanged` when
+        the action does not apply to the user's state, or `not_found`.
+        """
+        with transaction.atomic():
+            if ids is not None:
+                users = cls.objects.filter(pk__in=ids)
+            else:
+                users = cls.objects.filter(approved=False, cancelled=False)
+                if pending is not None:
+                    users = users.filter(pending)
+
+            found = dict(
+                users.select_for_update()
+                .annotate(
+                    applies=models.ExpressionWrapper(
+                        action.condition, output_field=models.BooleanField()
+                    )
+                )
+                .values_list("pk", "applies")
+            )
+            changed = [pk for pk, applies in found.items() if applies]
+            if changed:
+                cls.objects.filter(action.condition, pk__in=changed).update(
+                    **action.changes
+                )
+                users_changed.send(sender=cls, user_ids=changed)
+
+        outcomes = {pk: "not_found" for pk in ids or []}
+        outcomes.update(
+            (pk, action.outcome if applies else "unchanged") for pk, applies in found.items()
+        )
+        return outcomes
+
     def get_link_for_event(self, event: LabEvent):
         return self.labs.filter(event=event).first()  # type: ignore
 
     def get_number_applied_active_labs(self):
         return self.labs.filter(event__lab_datetime__gte=timezone.now()).count()  # type: ignore
 
+    def get_active_event_ids(self) -> set[int]:
+        """Upcoming events the user is applied for."""
+        return set(
+            self.labs.filter(event__lab_datetime__gte=timezone.now()).values_list(  # type: ignore
+                "event_id", flat=True
+            )
+        )
+
     def can_apply(self):
         return self.get_number_applied_active_labs() < MAX_USER_APPLIES
+
+
+class ExportJobLost(Exception):
+    """The job was requeued while its worker was still running it."""
+
+
+class ExportJob(models.Model):
+    """CSV export run by the `run_export_jobs` worker into `EXPORT_ROOT`.
+
+    Jobs are claimed by a conditional `UPDATE` of their status, so any number
+    of workers can poll the table. Finished jobs are deleted with their files
+    after `EXPORT_RETENTION`.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    # failed or abandoned jobs are queued again until started this many times
+    MAX_ATTEMPTS: int = 3
+
+    kind = models.CharField(max_length=16, choices=ExportKind.choices)
+    range_start = models.DateTimeField()
+    range_end = models.DateTimeField()
+    # `api.export_validators` of the exported links when requested, equal
+    # for equal data, so a recent job is reused instead of run again
+    etag = models.CharField(max_length=64)
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_by = models.ForeignKey(
+        "CustomUser", related_name="exports", on_delete=models.SET_NULL, null=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    # written by the worker while running, see `requeue_stale`
+    heartbeat = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    # relative to `EXPORT_ROOT`
+    file = models.CharField(max_length=255, blank=True)
+    rows = models.PositiveIntegerField(null=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # queue order of `claim_next`
+            models.Index(fields=["status", "created_at"], name="export_queue_idx"),
+            models.Index(fields=["kind", "etag"], name="export_reuse_idx"),
+        ]
+
+    @property
+    def path(self) -> Path:
+        return Path(settings.EXPORT_ROOT) / self.file
+
+    @property
+    def filename(self) -> str:
+        return f"{self.kind}_labs.csv"
+
+    def links(self):
+        return LinkTopicEvent.get_export(
+            ExportKind(self.kind), self.range_start, self.range_end
+        )
+
+    @classmethod
+    def request(cls, kind: ExportKind, etag: str, start: datetime, end: datetime, user):
+        """A queued, running or finished job of equal data, otherwise a new one.
+
+        Returns `(job, created)`.
+        """
+        reusable = (
+            cls.objects.filter(kind=kind, etag=etag)
+            .exclude(status=cls.Status.FAILED)
+            .order_by("-created_at")
+            .first()
+        )
+        if reusable is not None:
+            return reusable, False
+        job = cls.objects.create(
+            kind=kind, etag=etag, range_start=start, range_end=end, created_by=user
+        )
+        return job, True
+
+    @classmethod
+    def claim_next(cls) -> "ExportJob | None":
+        """Take the oldest pending job for this worker, None when there is none."""
+        while True:
+            pk = (
+                cls.objects.filter(status=cls.Status.PENDING)
+                .order_by("created_at", "pk")
+                .values_list("pk", flat=True)
+                .first()
+            )
+            if pk is None:
+                return None
+            # lost to another worker when no row matches any more
+            now = timezone.now()
+            if cls.objects.filter(pk=pk, status=cls.Status.PENDING).update(
+                status=cls.Status.RUNNING,
+                started_at=now,
+                heartbeat=now,
+                attempts=models.F("attempts") + 1,
+            ):
+                return cls.objects.get(pk=pk)
+
+    def _own(self):
+        """This job while still held by this attempt, requeued jobs belong to a new one."""
+        return ExportJob.objects.filter(
+            pk=self.pk, status=self.Status.RUNNING, attempts=self.attempts
+        )
+
+    def beat(self) -> None:
+        """Record that the worker is alive, `ExportJobLost` once the job was requeued."""
+        if not self._own().update(heartbeat=timezone.now()):
+            raise ExportJobLost(f"export job {self.pk} was requeued")
+
+    def run(self, chunk_size: int) -> None:
+        """Write the export to a temporary file renamed into place when complete.
+
+        The heartbeat is written every `chunk_size` rows. The temporary file
+        is named by the attempt, so a requeued job never shares it with the
+        worker it was taken from.
+        """
+        file = f"{self.pk}-{self.kind}.csv"
+        path = Path(settings.EXPORT_ROOT) / file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f"{file}.{self.attempts}.part")
+        rows = -1  # without the header
+
+        links = self.links().select_related("event", "topic", "user")
+        try:
+            with open(partial, "w", encoding="utf-8", newline="") as f:
+                for line in LinkTopicEvent.iter_csv(iterate_in_chunks(links, chunk_size)):
+                    f.write(line)
+                    rows += 1
+                    if rows and rows % chunk_size == 0:
+                        self.beat()
+            self.beat()
+            partial.replace(path)
+        finally:
+            partial.unlink(missing_ok=True)
+
+        self.file = file
+        self.status = self.Status.DONE
+        self.rows = rows
+        self.finished_at = timezone.now()
+        self._own().update(
+            file=self.file, status=self.status, rows=rows, finished_at=self.finished_at
+        )
+
+    def fail(self, error: str) -> None:
+        """Queue the job again unless it was started `MAX_ATTEMPTS` times."""
+        retry = self.attempts < self.MAX_ATTEMPTS
+        self.status = self.Status.PENDING if retry else self.Status.FAILED
+        self.error = error
+        self.finished_at = None if retry else timezone.now()
+        self._own().update(status=self.status, error=error, finished_at=self.finished_at)
+
+    @classmethod
+    def requeue_stale(cls, timeout: timedelta) -> int:
+        """Jobs without a heartbeat for `timeout` lost their worker, queue them
+        again or fail them after `MAX_ATTEMPTS`, so a job killing its worker
+        is not retried forever."""
+        stale = cls.objects.filter(
+            status=cls.Status.RUNNING, heartbeat__lt=timezone.now() - timeout
+        )
+        failed = stale.filter(attempts__gte=cls.MAX_ATTEMPTS).update(
+            status=cls.Status.FAILED,
+            error="worker lost",
+            finished_at=timezone.now(),
+        )
+        return failed + stale.update(status=cls.Status.PENDING)
+
+    @classmethod
+    def purge(cls, retention: timedelta) -> int:
+        """Delete jobs finished before `retention` ago and their files."""
+        expired = list(
+            cls.objects.filter(
+                status__in=[cls.Status.DONE, cls.Status.FAILED],
+                finished_at__lt=timezone.now() - retention,
+            )
+        )
+        root = Path(settings.EXPORT_ROOT)
+        for job in expired:
+            if job.file:
+                job.path.unlink(missing_ok=True)
+            # left behind by workers that died
+            for partial in root.glob(f"{job.pk}-*.part"):
+                partial.unlink(missing_ok=True)
+        cls.objects.filter(pk__in=[job.pk for job in expired]).delete()
+        return len(expired)
+
+    def json(self):
+        return {
+            "id": self.pk,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": repr_format(self.created_at),
+            "finished_at": self.finished_at and repr_format(self.finished_at),
+            "rows": self.rows,
+            "error": self.error,
+            "download": reverse("api_export_job_download", args=[self.pk])
+            if self.status == self.Status.DONE
+            else None,
+        }
@@ -0,0 +1,201 @@
+"""Profiles of single requests, taken by `ProfilingMiddleware`.
+
+Each profiled request leaves up to three files named by its request id in
+`PROFILING_DIR`: `<id>.prof` (pstats of cProfile) or `<id>.collapsed`
+(sampled stacks, one `frame;frame;... count` line each, the input of
+flamegraph.pl or speedscope) and `<id>.sql.json` with the executed queries.
+"""
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpRequest
+
+from .middleware import QueryRecorder
+
+PROFILERS = ("cprofile", "sample")
+SAMPLE_INTERVAL: float = 0.001
+
+
+class StackSampler:
+    """Samples the stack of one thread from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+class QueryLog(QueryRecorder):
+    """`QueryRecorder` keeping every query with its parameters and duration."""
+
+    def __init__(self):
+        super().__init__()
+        self.queries: list[dict] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            self.queries.append(
+                {
+                    "sql": sql,
+                    "params": [repr(p) for p in params or ()] if not many else "many",
+                    "ms": round(duration * 1000, 3),
+                }
+            )
+
+
+def request_id(header: str | None) -> str:
+    """The request id of a proxy if safe for a file name, a new one otherwise."""
+    if header and re.fullmatch(r"[\w.-]{1,64}", header):
+        return header
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def profiled(directory: Path, rid: str, profiler: str, meta: dict, asynchronous: bool = False):
+    """Profile the block by `profiler` and write the profile files when it ends.
+
+    `asynchronous` records the queries of an awaited async view, whose ORM
+    calls run in `sync_to_async` threads.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    log = QueryLog()
+    start = time.perf_counter()
+
+    with log.record_async() if asynchronous else log.record():
+        if profiler == "sample":
+            with StackSampler(threading.get_ident()) as sampler:
+                yield
+            (directory / f"{rid}.collapsed").write_text(sampler.collapsed())
+        else:
+            cprofiler = cProfile.Profile()
+            cprofiler.enable()
+            try:
+                yield
+            finally:
+                cprofiler.disable()
+            cprofiler.dump_stats(directory / f"{rid}.prof")
+
+    meta = {
+        **meta,
+        "request_id": rid,
+        "profiler": profiler,
+        "ms": round((time.perf_counter() - start) * 1000, 3),
+        "db_ms": round(log.duration * 1000, 3),
+        "queries": log.queries,
+    }
+    (directory / f"{rid}.sql.json").write_text(json.dumps(meta, indent=2))
+
+
+def profile(directory: Path, rid: str, profiler: str, call, meta: dict):
+    """Run `call()` under `profiler` and write the profile files, returns its result."""
+    with profiled(directory, rid, profiler, meta):
+        return call()
+
+
+class ProfilingMiddleware:
+    """Profile single requests of staff on demand.
+
+    Enabled by `PROFILING_ENABLED`, a staff request is profiled when it has the
+    `X-Profile` header or the `_profile` query parameter, their value picks
+    the profiler, `cprofile` (default) or `sample`. The files are named by
+    `X-Request-ID` or a new id, returned in `X-Profile-Id`. Keep it last, so
+    the user is known and only the view and its templates are profiled.
+
+    Async capable. Under ASGI the profile is of the event loop thread while
+    the async view is awaited, so other requests served meanwhile show up in
+    it and the ORM calls run by `sync_to_async` threads do not, their queries
+    are logged all the same.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def requested(request: HttpRequest) -> str | None:
+        """The profiler asked for by the request."""
+        requested = request.headers.get("X-Profile", request.GET.get("_profile"))
+        if requested is None:
+            return None
+        return requested if requested in PROFILERS else "cprofile"
+
+    @staticmethod
+    def target(request: HttpRequest) -> tuple[Path, str, dict]:
+        rid = request_id(request.headers.get("X-Request-ID"))
+        meta = {"method": request.method, "path": request.get_full_path()}
+        return Path(settings.PROFILING_DIR), rid, meta
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        profiler = self.requested(request)
+        if profiler is None or not request.user.is_staff:  # type: ignore
+            return self.get_response(request)
+
+        directory, rid, meta = self.target(request)
+        response = profile(directory, rid, profiler, lambda: self.get_response(request), meta)
+        response["X-Profile-Id"] = rid
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        profiler = self.requested(request)
+        # the lazy user queries the database
+        if profiler is None or not await sync_to_async(lambda: request.user.is_staff)():  # type: ignore
+            return await self.get_response(request)
+
+        directory, rid, meta = self.target(request)
+        with profiled(directory, rid, profiler, meta, asynchronous=True):
+            response = await self.get_response(request)
+        response["X-Profile-Id"] = rid
+        return response
@@ -0,0 +1,90 @@
+from collections.abc import Iterable
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import Signal, receiver
+
+from .cache import TOPICS_VERSION_KEY, bump_events, bump_version, forget_users
+from .middleware import QueryRecorder
+
+# sent by code changing seats with `QuerySet.update`, which bypasses model
+# signals, `event_ids` is None when every event may have changed
+seats_changed = Signal()
+# sent by code changing users with `QuerySet.update`
+users_changed = Signal()
+
+
+def invalidate_events(event_ids: Iterable[int] | None) -> None:
+    event_ids = None if event_ids is None else list(event_ids)
+    transaction.on_commit(lambda: bump_events(event_ids))
+
+
+# senders are lazy references, `models` imports this module for `seats_changed`
+
+
+@receiver([post_save, post_delete], sender="main.LinkTopicEvent")
+def link_changed(sender, instance, **kwargs):
+    invalidate_events([instance.event_id])
+
+
+@receiver([post_save, post_delete], sender="main.LabEvent")
+def event_changed(sender, instance, **kwargs):
+    invalidate_events([instance.pk])
+
+
+# `LinkTopicEvent` is the through model of `LabEvent.topics`
+@receiver(m2m_changed, sender="main.LinkTopicEvent")
+def event_topics_changed(sender, instance, action: str, reverse: bool, **kwargs):
+    if action not in {"post_add", "post_remove", "post_clear"}:
+        return
+    invalidate_events(None if reverse else [instance.pk])
+
+
+@receiver([post_save, post_delete], sender="main.LabTopic")
+def topic_changed(sender, instance, **kwargs):
+    # titles are part of every cached roster
+    transaction.on_commit(lambda: bump_version(TOPICS_VERSION_KEY))
+    invalidate_events(None)
+
+
+@receiver(seats_changed)
+def seats_changed_receiver(sender, event_ids: Iterable[int] | None, **kwargs):
+    invalidate_events(event_ids)
+
+
+def invalidate_users(user_ids: Iterable[int]) -> None:
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: forget_users(user_ids))
+
+
+@receiver([post_save, post_delete], sender="main.CustomUser")
+def user_changed(sender, instance, **kwargs):
+    # approval, cancellation, staff and the password are part of the cached user
+    invalidate_users([instance.pk])
+
+
+@receiver(pre_delete, sender="main.CustomUser")
+def user_deleting(sender, instance, **kwargs):
+    # the cascade deletes the user and the links of the user in any order (the
+    # key is nullable), so the links go first and their events are refreshed
+    # here, also for `QuerySet.delete`, which does not call `CustomUser.delete`
+    links = instance.labs.all()
+    if event_ids := list(links.values_list("event_id", flat=True)):
+        from .models import LabEvent
+
+        # the collector still sends `post_delete` for them
+        links._raw_delete(links.db)
+        LabEvent.refresh_counters(event_ids)
+
+
+@receiver(users_changed)
+def users_changed_receiver(sender, user_ids: Iterable[int], **kwargs):
+    invalidate_users(user_ids)
+
+
+@receiver(connection_created)
+def install_async_recorder(sender, connection, **kwargs):
+    # first, `execute_wrapper` removes the last wrapper when its block ends
+    if QueryRecorder.dispatch_async not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, QueryRecorder.dispatch_async)
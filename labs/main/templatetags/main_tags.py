@@ -1,6 +1,8 @@
 from django import template
+from django.core.cache import cache
 import typing as t
 from datetime import datetime
+from ..cache import EVENT_CACHE_TIMEOUT, event_fragment_key, record_fragment
 from ..utils import repr_format
 
 register = template.Library()
@@ -15,3 +17,48 @@ def date_string(value: datetime):
 def call(obj, method_name: str, *args):
     method: t.Callable[..., t.Any] = getattr(obj, method_name)
     return method(*args)
+
+
+class EventCacheNode(template.Node):
+    def __init__(self, nodelist, event, name, vary_on):
+        self.nodelist = nodelist
+        self.event = event
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        event = self.event.resolve(context)
+        name = self.name.resolve(context)
+        key = event_fragment_key(
+            event.pk, name, [var.resolve(context) for var in self.vary_on]
+        )
+
+        content = cache.get(key)
+        record_fragment(name, content is not None)
+        if content is None:
+            content = self.nodelist.render(context)
+            cache.set(key, content, EVENT_CACHE_TIMEOUT)
+        return content
+
+
+@register.tag
+def eventcache(parser, token):
+    """Cache the enclosed fragment until a seat of the event changes.
+
+        {% eventcache event "roster" [vary_on ...] %} ... {% endeventcache %}
+
+    Keep per-user content out of the fragment or in `vary_on`.
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' takes at least two arguments, the event and a fragment name"
+        )
+    nodelist = parser.parse(("endeventcache",))
+    parser.delete_first_token()
+    return EventCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
@@ -1,3 +1,1844 @@
-from django.test import TestCase
+import gzip
+import importlib.util
+import json
+import os
+import pickle
+import pstats
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import brotli
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.utils import load_backend
+from django.http import HttpResponse
+from django.templatetags.static import static
+from django.test import (
+    AsyncRequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from . import api, api_async, benchmark, datagen, metrics
+from .backends.pool import ConnectionPool, PooledDatabaseWrapperMixin, PoolTimeout
+from .cache import fragment_stats, get_event_version, user_cache_key
+from .models import (
+    MAX_USER_APPLIES,
+    CustomUser,
+    ExportJob,
+    ExportJobLost,
+    LabEvent,
+    LabTopic,
+    LinkTopicEvent,
+    RequestAction,
+    SeatClaim,
+)
+from .middleware import MetricsMiddleware, QueryBudgetMiddleware
+from .profiling import ProfilingMiddleware
+from .signals import seats_changed
+
+FAST_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+NUM_STUDENTS = 120
+NUM_PENDING = 30
+NUM_TOPICS = 25
+NUM_EVENTS = 30
+NUM_PAST_EVENTS = 20
+TOPICS_PER_EVENT = 10
+CAPACITY = 8
+
+
+def seed():
+    """Registration week sized data: upcoming events half booked, history and pending registrations."""
+    cache.clear()
+    now = timezone.now()
+    password = make_password("heslo123")
+
+    staff = CustomUser.objects.create_user(  # type: ignore
+        email="staff@fs.cvut.cz", password="heslo123", fullname="Staff", is_staff=True
+    )
+    CustomUser.objects.bulk_create(
+        CustomUser(
+            email=f"student{i}@fs.cvut.cz",
+            fullname=f"Student {i}",
+            password=password,
+        )
+        for i in range(NUM_STUDENTS)
+    )
+    CustomUser.objects.bulk_create(
+        CustomUser(
+            email=f"pending{i}@fs.cvut.cz",
+            fullname=f"Pending {i}",
+            password=password,
+            approved=False,
+            date_joined=now - timedelta(minutes=i),
+        )
+        for i in range(NUM_PENDING)
+    )
+    students = list(CustomUser.objects.filter(email__startswith="student"))
+
+    LabTopic.objects.bulk_create(
+        LabTopic(title=f"Téma {i}", created_by=staff) for i in range(NUM_TOPICS)
+    )
+    topics = list(LabTopic.objects.all())
+
+    for i in range(NUM_EVENTS + NUM_PAST_EVENTS):
+        lab_datetime = now + timedelta(days=i - NUM_PAST_EVENTS, hours=1)
+        LabEvent(
+            lab_datetime=lab_datetime,
+            close_login=lab_datetime - timedelta(days=1),
+            close_logout=lab_datetime - timedelta(days=1),
+            capacity=CAPACITY,
+            created_by=staff,
+        ).save()
+
+    links = []
+    for i, event in enumerate(LabEvent.objects.order_by("lab_datetime")):
+        for j in range(TOPICS_PER_EVENT):
+            user = None
+            if j < CAPACITY // 2:
+                user = students[(i * CAPACITY + j) % NUM_STUDENTS]
+            links.append(
+                LinkTopicEvent(
+                    event=event, topic=topics[(i + j) % NUM_TOPICS], user=user
+                )
+            )
+    LinkTopicEvent.objects.bulk_create(links)
+    LabEvent.refresh_counters()
+
+    return staff
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, CACHES=TEST_CACHES)
+class QueryCountTestCase(TestCase):
+    """Pins the number of queries of every view, an N+1 regression fails here."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = seed()
+        cls.event = LabEvent.objects.filter(
+            close_login__gt=timezone.now() + timedelta(days=2)
+        ).order_by("lab_datetime")[0]
+        cls.applied = CustomUser.objects.get(
+            pk=cls.event.get_roster(cls.staff).applied[0].user_id
+        )
+        cls.fresh = CustomUser.objects.create_user(  # type: ignore
+            email="fresh@fs.cvut.cz", password="heslo123", fullname="Fresh Student"
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, user: CustomUser):
+        self.client.force_login(user)
+
+    def test_home(self):
+        self.login(self.fresh)
+        with self.assertNumQueries(2):
+            self.client.get(reverse("home"))
+
+    def test_login_page(self):
+        with self.assertNumQueries(0):
+            self.client.get(reverse("login"))
+
+    def test_login(self):
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                reverse("login"),
+                {"email": "fresh@fs.cvut.cz", "password": "heslo123"},
+            )
+        self.assertRedirects(response, reverse("home"), fetch_redirect_response=False)
+
+    def test_register(self):
+        with self.assertNumQueries(1):
+            self.client.post(
+                reverse("register"),
+                {
+                    "fullname": "New Student",
+                    "email": "new@fs.cvut.cz",
+                    "password": "heslo123",
+                    "password_confirm": "heslo123",
+                },
+            )
+
+    def test_logout(self):
+        self.login(self.fresh)
+        with self.assertNumQueries(4):
+            self.client.get(reverse("logout"))
+
+    def test_topics_page(self):
+        self.login(self.staff)
+        with self.assertNumQueries(2):
+            self.client.get(reverse("topics"))
+
+    def test_create_event_page(self):
+        self.login(self.staff)
+        with self.assertNumQueries(3):
+            self.client.get(reverse("create_event"))
+
+    def test_create_event(self):
+        self.login(self.staff)
+        lab_datetime = timezone.now() + timedelta(days=10)
+        topic_ids = list(LabTopic.objects.values_list("id", flat=True)[:5])
+        fmt = "%Y-%m-%d %H:%M"
+        with self.assertNumQueries(7):
+            response = self.client.post(
+                reverse("create_event"),
+                {
+                    "capacity": 5,
+                    "lab_datetime": lab_datetime.strftime(fmt),
+                    "close_login": (lab_datetime - timedelta(days=2)).strftime(fmt),
+                    "close_logout": (lab_datetime - timedelta(days=1)).strftime(fmt),
+                    "topics": topic_ids,
+                },
+            )
+        self.assertRedirects(response, reverse("home"), fetch_redirect_response=False)
+
+    def test_event_page_student(self):
+        self.login(self.fresh)
+        with self.assertNumQueries(5):
+            self.client.get(reverse("apply_event", args=[self.event.id]))  # type: ignore
+
+    def test_event_page_cached_roster(self):
+        self.login(self.fresh)
+        self.client.get(reverse("apply_event", args=[self.event.id]))  # type: ignore
+        with self.assertNumQueries(4):
+            self.client.get(reverse("apply_event", args=[self.event.id]))  # type: ignore
+
+    def test_event_page_applied_student(self):
+        self.login(self.applied)
+        with self.assertNumQueries(4):
+            self.client.get(reverse("apply_event", args=[self.event.id]))  # type: ignore
+
+    def test_event_page_staff(self):
+        self.login(self.staff)
+        with self.assertNumQueries(4):
+            self.client.get(reverse("apply_event", args=[self.event.id]))  # type: ignore
+
+    def test_apply(self):
+        self.login(self.fresh)
+        topic_id = self.event.get_roster(self.fresh).free_topics[0][0]
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                reverse("apply_event", args=[self.event.id]) + "?operation=apply",  # type: ignore
+                {"topics": topic_id},
+            )
+        self.assertEqual(response.status_code, 302)
+
+    def test_logout_from_event(self):
+        self.login(self.applied)
+        with self.assertNumQueries(8):
+            self.client.post(
+                reverse("apply_event", args=[self.event.id]) + "?operation=logout"  # type: ignore
+            )
+
+    def test_my_labs(self):
+        self.login(self.applied)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("my_labs"))
+        self.assertContains(response, self.event.get_roster(self.applied).user_topic.title)  # type: ignore
+
+    def test_api_my_labs(self):
+        self.login(self.applied)
+        with self.assertNumQueries(3):
+            content = self.client.get(reverse("api_my_labs")).json()["content"]
+        event = next(e for e in content if e["id"] == self.event.id)  # type: ignore
+        topic = self.event.get_roster(self.applied).user_topic
+        self.assertEqual(event["topic"], {"id": topic.id, "title": topic.title})  # type: ignore
+        self.assertEqual(event["num_users"], self.event.applied_count)
+        self.assertEqual(
+            [e["id"] for e in content],
+            list(LabEvent.get_user_events(self.applied).values_list("id", flat=True)),
+        )
+
+    def test_approve_page(self):
+        self.login(self.staff)
+        with self.assertNumQueries(2):
+            self.client.get(reverse("approve_page"))
+
+    def test_export_page(self):
+        self.login(self.staff)
+        with self.assertNumQueries(2):
+            self.client.get(reverse("export"))
+
+    def test_delete_event(self):
+        self.login(self.staff)
+        with self.assertNumQueries(6):
+            self.client.get(reverse("delete_event", args=[self.event.id]))  # type: ignore
+
+    def test_api_topics(self):
+        self.login(self.staff)
+        with self.assertNumQueries(1):
+            self.client.get(reverse("api_topics"))
+        with self.assertNumQueries(0):
+            self.client.get(reverse("api_topics"))
+
+    def test_api_new_topic(self):
+        self.login(self.staff)
+        with self.assertNumQueries(7):
+            self.client.post(
+                reverse("api_new_topic"),
+                json.dumps({"topic": "Nové téma"}),
+                content_type="application/json",
+            )
+
+    def test_api_modify_topic(self):
+        self.login(self.staff)
+        topic = LabTopic.objects.first()
+        with self.assertNumQueries(8):
+            self.client.put(
+                reverse("api_modify_topic"),
+                json.dumps({"id": topic.id, "topic": "Přejmenované téma"}),  # type: ignore
+                content_type="application/json",
+            )
+
+    def test_api_remove_topic(self):
+        self.login(self.staff)
+        topic = LabTopic.objects.first()
+        with self.assertNumQueries(10):
+            self.client.delete(
+                reverse("api_remove_topic"),
+                json.dumps({"id": topic.id}),  # type: ignore
+                content_type="application/json",
+            )
+
+    def test_api_events(self):
+        self.login(self.fresh)
+        for size in (3, NUM_EVENTS):
+            with self.assertNumQueries(4):
+                response = self.client.get(reverse("api_events"), {"size": size})
+            self.assertEqual(len(response.json()["content"]), size)
+
+        with self.assertNumQueries(3):
+            self.client.get(reverse("api_events"), {"size": NUM_EVENTS})
+
+    def test_api_events_cursor(self):
+        self.login(self.fresh)
+        cursor = self.client.get(reverse("api_events"), {"size": 3}).json()["next"]
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                reverse("api_events"), {"size": 3, "cursor": cursor}
+            )
+        self.assertEqual(len(response.json()["content"]), 3)
+
+    def test_api_events_paginator(self):
+        self.login(self.fresh)
+        with self.assertNumQueries(4):
+            self.client.get(reverse("api_events"), {"page": 2})
+
+    def test_api_register_requests(self):
+        self.login(self.staff)
+        with self.assertNumQueries(3):
+            self.client.get(reverse("api_register_requests"), {"size": 20})
+
+    def test_api_approve_user(self):
+        self.login(self.staff)
+        pending = CustomUser.objects.filter(approved=False).first()
+        with self.assertNumQueries(4):
+            self.client.get(reverse("api_approve_user", args=[pending.id]))  # type: ignore
+
+    def test_api_decline_user(self):
+        self.login(self.staff)
+        pending = CustomUser.objects.filter(approved=False).first()
+        with self.assertNumQueries(4):
+            self.client.get(reverse("api_decline_user", args=[pending.id]))  # type: ignore
+
+    def test_api_remove_user_from_event(self):
+        self.login(self.staff)
+        url = reverse(
+            "api_remove_user_from_event", args=[self.event.id, self.applied.id]  # type: ignore
+        )
+        with self.assertNumQueries(8):
+            self.client.get(url)
+
+    def test_api_export_history(self):
+        self.login(self.staff)
+        # the validators, then the rows
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("api_export_history"))
+            content = b"".join(response.streaming_content)  # type: ignore
+        self.assertEqual(
+            len(content.decode().splitlines()), 1 + NUM_PAST_EVENTS * TOPICS_PER_EVENT
+        )
+
+    def test_api_export_closed(self):
+        self.login(self.staff)
+        # the validators, then the rows
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("api_export_closed"))
+            b"".join(response.streaming_content)  # type: ignore
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, CACHES=TEST_CACHES)
+class TopicCatalogTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(  # type: ignore
+            email="staff@fs.cvut.cz", password="heslo123", is_staff=True
+        )
+        LabTopic.objects.create(title="Kyvadlo", created_by=cls.staff)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def test_not_modified(self):
+        etag = self.client.get(reverse("api_topics"))["ETag"]
+
+        response = self.client.get(reverse("api_topics"), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_change_invalidates_catalog(self):
+        etag = self.client.get(reverse("api_topics"))["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("api_new_topic"),
+                json.dumps({"topic": "Nakloněná rovina"}),
+                content_type="application/json",
+            )
+        response = self.client.get(reverse("api_topics"), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [topic["title"] for topic in response.json()],
+            ["Kyvadlo", "Nakloněná rovina"],
+        )
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, CACHES=TEST_CACHES)
+class ConditionalGetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = seed()
+        cls.student = CustomUser.objects.filter(approved=True, is_staff=False).last()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feed_not_modified(self):
+        self.client.force_login(self.student)
+        response = self.client.get(reverse("api_events"), {"size": 5})
+        response_content, etag = response.json(), response["ETag"]
+
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse("api_events"), {"size": 5}, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+
+        event = LabEvent.objects.get(pk=response_content["content"][0]["id"])
+        with self.captureOnCommitCallbacks(execute=True):
+            LabEvent.objects.filter(pk=event.pk).update(capacity=event.capacity + 1)
+            seats_changed.send(sender=LabEvent, event_ids=[event.pk])
+        response = self.client.get(reverse("api_events"), {"size": 5}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["content"][0]["capacity"], event.capacity + 1)
+
+    def test_feed_etag_per_user(self):
+        self.client.force_login(self.student)
+        etag = self.client.get(reverse("api_events"), {"size": 30})["ETag"]
+        applied = LinkTopicEvent.objects.filter(
+            user__isnull=False, event__lab_datetime__gt=timezone.now()
+        ).exclude(user=self.student)[0].user
+        self.client.force_login(applied)
+        response = self.client.get(reverse("api_events"), {"size": 30}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_not_modified(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("api_export_history"))
+        b"".join(response.streaming_content)  # type: ignore
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get(
+            reverse("api_export_history"), HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+        link = LinkTopicEvent.objects.filter(
+            user__isnull=False, event__lab_datetime__lt=timezone.now()
+        ).first()
+        etag = response["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            link.event.release_seat(link.user)
+        response = self.client.get(reverse("api_export_history"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, CACHES=TEST_CACHES, COMPRESS_MIN_SIZE=1024)
+class CompressionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = seed()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def test_json(self):
+        plain = self.client.get(reverse("api_events"), {"size": 30})
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertIn("Accept-Encoding", plain["Vary"])
+
+        for encoding, decompress in (("br", brotli.decompress), ("gzip", gzip.decompress)):
+            response = self.client.get(
+                reverse("api_events"), {"size": 30}, HTTP_ACCEPT_ENCODING=f"{encoding}, deflate"
+            )
+            self.assertEqual(response["Content-Encoding"], encoding)
+            self.assertEqual(decompress(response.content), plain.content)
+            self.assertEqual(response["ETag"], f"W/{plain['ETag']}")
+
+        # conditional requests match the weakened ETag
+        response = self.client.get(
+            reverse("api_events"),
+            {"size": 30},
+            HTTP_ACCEPT_ENCODING="br",
+            HTTP_IF_NONE_MATCH=f"W/{plain['ETag']}",
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_small_or_refused(self):
+        response = self.client.get(reverse("api_events"), {"size": 1}, HTTP_ACCEPT_ENCODING="br")
+        self.assertNotIn("Content-Encoding", response)
+        response = self.client.get(
+            reverse("api_events"), {"size": 30}, HTTP_ACCEPT_ENCODING="br;q=0, identity"
+        )
+        self.assertNotIn("Content-Encoding", response)
+
+    def test_csv_stream(self):
+        plain = b"".join(self.client.get(reverse("api_export_history")).streaming_content)  # type: ignore
+        response = self.client.get(reverse("api_export_history"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), plain)  # type: ignore
+
+    def test_html_untouched(self):
+        response = self.client.get(reverse("home"), HTTP_ACCEPT_ENCODING="br")
+        self.assertNotIn("Content-Encoding", response)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, CACHES=TEST_CACHES)
+class SeatClaimTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(  # type: ignore
+            email="staff@fs.cvut.cz", password="heslo123", fullname="Staff", is_staff=True
+        )
+        cls.students = [
+            CustomUser.objects.create_user(  # type: ignore
+                email=f"student{i}@fs.cvut.cz", password="heslo123", fullname=f"Student {i}"
+            )
+            for i in range(3)
+        ]
+        cls.topics = [
+            LabTopic.objects.create(title=f"Téma {i}", created_by=cls.staff) for i in range(3)
+        ]
+        cls.event = cls.create_event(capacity=2)
+
+    @classmethod
+    def create_event(cls, capacity: int, days: int = 7, topics=None) -> LabEvent:
+        lab_datetime = timezone.now() + timedelta(days=days)
+        event = LabEvent.objects.create(
+            lab_datetime=lab_datetime,
+            close_login=lab_datetime - timedelta(days=2),
+            close_logout=lab_datetime - timedelta(days=1),
+            capacity=capacity,
+            created_by=cls.staff,
+        )
+        LinkTopicEvent.objects.bulk_create(
+            LinkTopicEvent(event=event, topic=topic) for topic in topics or cls.topics
+        )
+        LabEvent.refresh_counters([event.pk])
+        event.refresh_from_db()
+        return event
+
+    def setUp(self):
+        cache.clear()
+
+    @staticmethod
+    def statements(queries) -> list[str]:
+        return [q["sql"] for q in queries if "SAVEPOINT" not in q["sql"]]
+
+    def test_claim_writes_event_first(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.event.claim_seat(self.students[0], self.topics[0].pk)
+        self.assertEqual(result, SeatClaim.CLAIMED)
+        self.assertRegex(self.statements(queries)[0], r"^UPDATE [`\"]main_labevent")
+
+    def assertCounters(self, event: LabEvent, applied: int, free: int):
+        event.refresh_from_db()
+        self.assertEqual((event.applied_count, event.free_topic_count), (applied, free))
+        self.assertFalse(LabEvent.get_counter_drift().exists())
+
+    def test_claimed(self):
+        result = self.event.claim_seat(self.students[0], self.topics[0].pk)
+        self.assertEqual(result, SeatClaim.CLAIMED)
+        self.assertEqual(self.event.links.get(user=self.students[0]).topic, self.topics[0])  # type: ignore
+        self.assertCounters(self.event, applied=1, free=2)
+
+    def test_already_applied(self):
+        self.event.claim_seat(self.students[0], self.topics[0].pk)
+        result = self.event.claim_seat(self.students[0], self.topics[1].pk)
+        self.assertEqual(result, SeatClaim.ALREADY_APPLIED)
+        self.assertCounters(self.event, applied=1, free=2)
+
+    def test_taken(self):
+        self.event.claim_seat(self.students[0], self.topics[0].pk)
+        result = self.event.claim_seat(self.students[1], self.topics[0].pk)
+        self.assertEqual(result, SeatClaim.TAKEN)
+        self.assertCounters(self.event, applied=1, free=2)
+
+    def test_full(self):
+        for student, topic in zip(self.students, self.topics[:2]):
+            self.event.claim_seat(student, topic.pk)
+        result = self.event.claim_seat(self.students[2], self.topics[2].pk)
+        self.assertEqual(result, SeatClaim.FULL)
+        self.assertCounters(self.event, applied=2, free=1)
+
+    def test_full_after_topic_deleted(self):
+        event = self.create_event(capacity=2, topics=self.topics[:2])
+        self.topics[1].delete()
+        self.assertCounters(event, applied=0, free=1)
+
+        self.assertEqual(event.claim_seat(self.students[0], self.topics[0].pk), SeatClaim.CLAIMED)
+        # seats remain but no topic, must not underflow the free topic counter
+        self.assertEqual(event.claim_seat(self.students[1], self.topics[0].pk), SeatClaim.FULL)
+        self.assertCounters(event, applied=1, free=0)
+
+    def test_user_deleted(self):
+        other = self.create_event(capacity=2, days=8)
+        for event in (self.event, other):
+            event.claim_seat(self.students[0], self.topics[0].pk)
+        self.event.claim_seat(self.students[1], self.topics[1].pk)
+
+        # the links of the user are deleted with the user
+        self.students[0].delete()
+        self.assertCounters(self.event, applied=1, free=1)
+        self.assertCounters(other, applied=0, free=2)
+
+        CustomUser.objects.filter(pk=self.students[1].pk).delete()
+        self.assertCounters(self.event, applied=0, free=1)
+
+    def test_limit_reached(self):
+        student = self.students[0]
+        for days in range(MAX_USER_APPLIES):
+            event = self.create_event(capacity=2, days=10 + days)
+            self.assertEqual(event.claim_seat(student, self.topics[0].pk), SeatClaim.CLAIMED)
+        result = self.event.claim_seat(student, self.topics[0].pk)
+        self.assertEqual(result, SeatClaim.LIMIT_REACHED)
+        self.assertCounters(self.event, applied=0, free=3)
+
+    def test_closed(self):
+        event = self.create_event(capacity=2, days=1)
+        self.assertEqual(event.claim_seat(self.students[0], self.topics[0].pk), SeatClaim.CLOSED)
+        self.assertCounters(event, applied=0, free=3)
+
+    def test_release_seat(self):
+        self.event.claim_seat(self.students[0], self.topics[0].pk)
+        self.assertTrue(self.event.release_seat(self.students[0]))
+        self.assertCounters(self.event, applied=0, free=3)
+        self.assertFalse(self.event.release_seat(self.students[0]))
+        self.assertCounters(self.event, applied=0, free=3)
+
+    def test_released_seat_claimed_again(self):
+        self.event.claim_seat(self.students[0], self.topics[0].pk)
+        self.event.release_seat(self.students[0])
+        result = self.event.claim_seat(self.students[1], self.topics[0].pk)
+        self.assertEqual(result, SeatClaim.CLAIMED)
+        self.assertCounters(self.event, applied=1, free=2)
+
+    def test_release_writes_event_first(self):
+        self.event.claim_seat(self.students[0], self.topics[0].pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.event.release_seat(self.students[0]))
+        self.assertRegex(self.statements(queries)[0], r"^UPDATE [`\"]main_labevent")
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, CACHES=TEST_CACHES)
+class EventCacheInvalidationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = seed()
+        cls.student = CustomUser.objects.create_user(  # type: ignore
+            email="fresh@fs.cvut.cz", password="heslo123", fullname="Fresh Student"
+        )
+        cls.event = LabEvent.get_feed().filter(
+            close_login__gt=timezone.now() + timedelta(days=2)
+        )[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.student)
+
+    def get_feed_event(self) -> dict:
+        content = self.client.get(reverse("api_events"), {"size": NUM_EVENTS}).json()
+        return next(e for e in content["content"] if e["id"] == self.event.id)  # type: ignore
+
+    def test_claim_invalidates_feed_and_roster(self):
+        before = self.get_feed_event()
+        topic_id = self.event.get_roster(self.student).free_topics[0][0]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.claim_seat(self.student, topic_id)
+
+        after = self.get_feed_event()
+        self.assertEqual(after["num_users"], before["num_users"] + 1)
+        self.assertTrue(after["applied"])
+        self.assertEqual(
+            self.event.get_roster(self.student).user_topic.id, topic_id  # type: ignore
+        )
+
+    def test_roster_caches_shown_values(self):
+        roster = self.event.get_roster(self.student)
+        user = CustomUser.objects.get(pk=roster.applied[0].user_id)
+        self.assertEqual(roster.applied[0].email, user.email)
+
+        key = f"event:{self.event.pk}:roster_values:{get_event_version(self.event.pk)}"
+        cached = pickle.dumps(cache.get(key))
+        self.assertNotIn(user.password.encode(), cached)
+        self.assertNotIn(b"CustomUser", cached)
+
+    def test_link_delete_invalidates_roster(self):
+        roster = self.event.get_roster(self.student)
+        link = self.event.links.get(user=roster.applied[0].user_id)  # type: ignore
+
+        with self.captureOnCommitCallbacks(execute=True):
+            link.delete()
+
+        self.assertEqual(
+            len(self.event.get_roster(self.student).applied), len(roster.applied) - 1
+        )
+
+    def test_fragments(self):
+        url = reverse("apply_event", args=[self.event.id])  # type: ignore
+        fragment_stats.clear()
+        def render():
+            # the masked CSRF token differs per response
+            content = self.client.get(url).content
+            return re.sub(rb'name="csrfmiddlewaretoken" value="\w+"', b"", content)
+
+        self.assertEqual(render(), render())
+        self.assertEqual(fragment_stats[("topics", "miss")], 1)
+        self.assertEqual(fragment_stats[("topics", "hit")], 1)
+
+        topic_id, title = self.event.get_roster(self.student).free_topics[0]
+        other = CustomUser.objects.filter(approved=True, is_staff=False).exclude(
+            labs__event=self.event
+        )[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.claim_seat(other, topic_id)
+
+        self.assertNotIn(f'value="{topic_id}"'.encode(), self.client.get(url).content)
+        self.assertEqual(fragment_stats[("topics", "miss")], 2)
+
+        # staff see the roster
+        self.client.force_login(self.staff)
+        self.client.get(url)
+        self.assertContains(self.client.get(url), other.fullname)
+        self.assertEqual(fragment_stats[("roster", "hit")], 1)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, CACHES=TEST_CACHES)
+class ScheduleTestCase(TestCase):
+    FMT = "%Y-%m-%d %H:%M"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = seed()
+        cls.topic_ids = list(LabTopic.objects.values_list("id", flat=True)[:5])
+        cls.first = (timezone.now() + timedelta(days=10)).replace(second=0, microsecond=0)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def post(self, **payload):
+        data = {
+            "capacity": 4,
+            "lab_datetime": self.first.strftime(self.FMT),
+            "close_login": (self.first - timedelta(days=2)).strftime(self.FMT),
+            "close_logout": (self.first - timedelta(days=1)).strftime(self.FMT),
+            "topics": self.topic_ids,
+            "occurrences": 10,
+            "interval_weeks": 1,
+            **payload,
+        }
+        return self.client.post(
+            reverse("api_create_schedule"), data, content_type="application/json"
+        )
+
+    def test_weekly_schedule(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post(interval_weeks=2)
+        self.assertEqual(response.status_code, 201)
+
+        ids = [event["id"] for event in response.json()["content"]]
+        events = list(LabEvent.objects.filter(pk__in=ids).order_by("lab_datetime"))
+        self.assertEqual(len(events), 10)
+        for i, event in enumerate(events):
+            self.assertEqual(event.lab_datetime, self.first + timedelta(weeks=2 * i))
+            self.assertEqual(event.lab_datetime - event.close_login, timedelta(days=2))
+            self.assertEqual(event.lab_datetime - event.close_logout, timedelta(days=1))
+            self.assertEqual(event.free_topic_count, len(self.topic_ids))
+            self.assertEqual(
+                sorted(event.links.values_list("topic_id", flat=True)), sorted(self.topic_ids)  # type: ignore
+            )
+        self.assertFalse(LabEvent.get_counter_drift().filter(pk__in=ids).exists())
+
+        # bulk created events invalidate the cached feed
+        feed = self.client.get(reverse("api_events"), {"size": 50}).json()["content"]
+        self.assertIn(ids[0], [event["id"] for event in feed])
+
+    def test_queries_do_not_grow_with_occurrences(self):
+        # session, user, topics, savepoint, 2 inserts, release
+        with self.assertNumQueries(7):
+            self.post(occurrences=1)
+        with self.assertNumQueries(7):
+            self.post(occurrences=30, lab_datetime=(self.first + timedelta(days=1)).strftime(self.FMT))
+
+    def test_validation(self):
+        response = self.post(close_logout=(self.first + timedelta(hours=1)).strftime(self.FMT))
+        self.assertEqual(response.status_code, 422)
+        self.assertIn("close_logout", response.json()["fields"])
+
+        # the rules of `LabEvent.save`
+        response = self.post(close_login=(self.first + timedelta(hours=1)).strftime(self.FMT))
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()["error"], "validation")
+
+        self.assertEqual(self.post(occurrences=100).status_code, 422)
+        self.assertFalse(LabEvent.objects.filter(lab_datetime=self.first).exists())
+
+    def test_malformed_payload(self):
+        url = reverse("api_create_schedule")
+        for body, message in (
+            ("[1, 2]", "payload must be JSON object"),
+            ('"schedule"', "payload must be JSON object"),
+            (b"\xff\xfe", "payload must be JSON"),
+            ("{", "payload must be JSON"),
+        ):
+            response = self.client.post(url, body, content_type="application/json")
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.json()["message"], message)
+
+    def test_staff_only(self):
+        self.client.force_login(CustomUser.objects.filter(is_staff=False).first())  # type: ignore
+        self.assertEqual(self.post().status_code, 403)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, CACHES=TEST_CACHES)
+class DataGenTestCase(TestCase):
+    SPEC = datagen.DataSpec(
+        users=60, pending=10, topics=20, events=12, topics_per_event=6, capacity=4
+    )
+
+    def snapshot(self, generated: datagen.Generated):
+        """The generated data without the database ids."""
+        users = {pk: i for i, pk in enumerate(generated.user_ids)}
+        titles = dict(LabTopic.objects.values_list("id", "title"))
+        links = LinkTopicEvent.objects.filter(event__in=generated.events).order_by("id")
+        return (
+            list(
+                CustomUser.objects.filter(pk__in=users)
+                .order_by("id")
+                .values_list("email", "approved", "date_joined")
+            ),
+            [[titles[topic_id] for topic_id in topics] for topics in generated.events.values()],
+            [(titles[l.topic_id], users.get(l.user_id)) for l in links],
+        )
+
+    def test_generate(self):
+        now = timezone.now()
+        generated = datagen.generate(self.SPEC, batch_size=7, now=now)
+
+        self.assertEqual(len(generated.user_ids), 60)
+        self.assertEqual(
+            CustomUser.objects.filter(pk__in=generated.user_ids, approved=False).count(), 10
+        )
+        events = LabEvent.objects.filter(pk__in=generated.events)
+        self.assertEqual(events.filter(lab_datetime__lt=now).count(), 6)
+        self.assertEqual(set(events.values_list("applied_count", flat=True)), {2})
+        self.assertEqual(set(events.values_list("free_topic_count", flat=True)), {4})
+        self.assertFalse(LabEvent.get_counter_drift().exists())
+        self.assertFalse(
+            LinkTopicEvent.objects.filter(
+                user__approved=False, event__in=generated.events
+            ).exists()
+        )
+
+    def test_deterministic(self):
+        now = timezone.now()
+        first = self.snapshot(datagen.generate(self.SPEC, now=now))
+        # the previous data with the prefix is replaced
+        second = self.snapshot(datagen.generate(self.SPEC, batch_size=5, now=now))
+        self.assertEqual(first, second)
+        self.assertEqual(CustomUser.objects.filter(email__startswith="gen-").count(), 61)
+
+        other = self.snapshot(
+            datagen.generate(self.SPEC._replace(random_seed=1), now=now)
+        )
+        self.assertNotEqual(first[2], other[2])
+
+    def test_cleanup(self):
+        generated = datagen.generate(self.SPEC)
+        datagen.cleanup(self.SPEC.prefix)
+        self.assertFalse(CustomUser.objects.filter(pk__in=generated.user_ids).exists())
+        self.assertFalse(LabTopic.objects.filter(title__startswith="gen-").exists())
+
+    def test_cleanup_keeps_other_data(self):
+        real = CustomUser.objects.create_user(  # type: ignore
+            email="gen-real@fs.cvut.cz", password="heslo123", fullname="Real", is_staff=True
+        )
+        topics = [LabTopic.objects.create(title=f"Téma {i}", created_by=real) for i in range(2)]
+        lab_datetime = timezone.now() + timedelta(days=7)
+        event = LabEvent.objects.create(
+            lab_datetime=lab_datetime,
+            close_login=lab_datetime - timedelta(days=2),
+            close_logout=lab_datetime - timedelta(days=1),
+            capacity=2,
+            created_by=real,
+        )
+        LinkTopicEvent.objects.bulk_create(
+            LinkTopicEvent(event=event, topic=topic) for topic in topics
+        )
+        LabEvent.refresh_counters([event.pk])
+
+        generated = datagen.generate(self.SPEC)
+        student = CustomUser.objects.get(pk=generated.user_ids[0])
+        self.assertEqual(event.claim_seat(student, topics[0].pk), SeatClaim.CLAIMED)
+        job = ExportJob.objects.create(
+            kind="history",
+            etag="-",
+            range_start=lab_datetime,
+            range_end=lab_datetime,
+            created_by_id=generated.staff_id,
+        )
+
+        datagen.cleanup(self.SPEC.prefix)
+        self.assertTrue(CustomUser.objects.filter(pk=real.pk).exists())
+        self.assertEqual(event.links.filter(user__isnull=True).count(), 2)  # type: ignore
+        event.refresh_from_db()
+        self.assertEqual((event.applied_count, event.free_topic_count), (0, 2))
+        job.refresh_from_db()
+        self.assertIsNone(job.created_by_id)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, CACHES=TEST_CACHES)
+class ResolveRequestsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = seed()
+        cls.pending = list(
+            CustomUser.objects.filter(approved=False, cancelled=False).order_by("id")
+        )
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def post(self, payload):
+        return self.client.post(
+            reverse("api_resolve_requests"), payload, content_type="application/json"
+        )
+
+    def test_ids(self):
+        student = CustomUser.objects.filter(email__startswith="student").first()
+        ids = [u.id for u in self.pending[:5]] + [student.id, 999_999]  # type: ignore
+
+        # session, user, savepoint, select for update, update, release
+        with self.assertNumQueries(6):
+            response = self.post({"action": "approve", "ids": ids})
+
+        results = response.json()["results"]
+        self.assertEqual([results[str(u.id)] for u in self.pending[:5]], ["approved"] * 5)
+        self.assertEqual(results[str(student.id)], "unchanged")  # type: ignore
+        self.assertEqual(results["999999"], "not_found")
+        self.assertEqual(response.json()["counts"], {"approved": 5, "unchanged": 1, "not_found": 1})
+        self.assertEqual(
+            CustomUser.objects.filter(pk__in=ids, approved=True).count(), 6
+        )
+
+        # declining an approved user is allowed, a cancelled one stays unchanged
+        response = self.post({"action": "decline", "ids": ids[:2]})
+        self.assertEqual(set(response.json()["results"].values()), {"declined"})
+        response = self.post({"action": "decline", "ids": ids[:2]})
+        self.assertEqual(set(response.json()["results"].values()), {"unchanged"})
+
+    def test_filter(self):
+        last = max(self.pending, key=lambda u: u.date_joined)
+        response = self.post(
+            {
+                "action": "decline",
+                "filter": {"joined_after": last.date_joined.isoformat()},
+            }
+        )
+        self.assertEqual(response.json()["results"], {str(last.id): "declined"})  # type: ignore
+
+        response = self.post({"action": "approve", "filter": {"email": "pending"}})
+        self.assertEqual(response.json()["counts"], {"approved": len(self.pending) - 1})
+        self.assertFalse(
+            CustomUser.objects.filter(approved=False, cancelled=False).exists()
+        )
+
+    def test_invalid(self):
+        for payload in (
+            {"action": "delete", "ids": [1]},
+            {"action": "approve"},
+            {"action": "approve", "ids": ["1"]},
+            {"action": "approve", "filter": {"joined_before": "yesterday"}},
+            {"action": "approve", "ids": [True]},
+            [1, 2],
+            "approve",
+        ):
+            self.assertEqual(self.post(payload).status_code, 400, payload)
+        self.assertEqual(
+            CustomUser.objects.filter(approved=False, cancelled=False).count(), len(self.pending)
+        )
+
+        # fixed messages, no exception text
+        self.assertEqual(
+            self.post({"action": "delete", "ids": [1]}).json()["message"],
+            "`action` must be `approve` or `decline`",
+        )
+        self.assertEqual(self.post([1, 2]).json()["message"], "payload must be JSON object")
+
+        self.client.force_login(self.pending[0])
+        self.assertEqual(self.post({"action": "approve", "ids": [1]}).status_code, 403)
+
+
+def parse_sse(content: bytes) -> list[dict[str, str]]:
+    messages = []
+    for block in content.decode().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if fields:
+            messages.append(fields)
+    return messages
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_HASHERS,
+    CACHES=TEST_CACHES,
+    SESSION_ENGINE="django.contrib.sessions.backends.cached_db",
+    AUTHENTICATION_BACKENDS=[
+        "main.auth.CachedModelBackend",
+        "django.contrib.auth.backends.ModelBackend",
+    ],
+)
+class SessionCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = seed()
+        cls.student = CustomUser.objects.filter(is_staff=False, approved=True).first()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_request(self):
+        self.client.force_login(self.student)
+        self.client.get(reverse("home"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("home"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_session_of_model_backend(self):
+        # logged in before the cached backend was enabled
+        self.client.force_login(
+            self.student, backend="django.contrib.auth.backends.ModelBackend"
+        )
+        self.assertEqual(self.client.get(reverse("home")).status_code, 200)
+
+    def test_login_logout(self):
+        response = self.client.post(
+            reverse("login"), {"email": self.student.email, "password": "heslo123"}
+        )
+        self.assertEqual(response.status_code, 302)
+        session_key = self.client.session.session_key
+        # written through to the database
+        self.assertTrue(Session.objects.filter(session_key=session_key).exists())
+
+        self.client.get(reverse("logout"))
+        self.assertFalse(Session.objects.filter(session_key=session_key).exists())
+        self.assertEqual(self.client.get(reverse("home")).status_code, 302)
+
+    def test_save_invalidates(self):
+        staff = CustomUser.objects.create_user(  # type: ignore
+            email="staff2@fs.cvut.cz", password="heslo123", fullname="Staff 2", is_staff=True
+        )
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse("approve_page")).status_code, 200)
+
+        staff.is_staff = False
+        with self.captureOnCommitCallbacks(execute=True):
+            staff.save()
+        self.assertEqual(self.client.get(reverse("approve_page")).status_code, 302)
+
+    def test_update_invalidates(self):
+        pending = CustomUser.objects.filter(approved=False, cancelled=False).first()
+        self.client.force_login(pending)
+        self.client.get(reverse("home"))
+        self.assertFalse(cache.get(user_cache_key(pending.pk)).approved)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.resolve_requests(RequestAction.APPROVE, [pending.pk])
+        self.assertIsNone(cache.get(user_cache_key(pending.pk)))
+        self.client.get(reverse("home"))
+        self.assertTrue(cache.get(user_cache_key(pending.pk)).approved)
+
+    def test_purge_sessions(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            Session(
+                session_key=f"expired{i}",
+                session_data="",
+                expire_date=now - timedelta(minutes=i + 1),
+            )
+            for i in range(5)
+        )
+        self.client.force_login(self.student)
+
+        out = StringIO()
+        call_command("purge_sessions", batch_size=2, pause=0, stdout=out)
+        self.assertIn("deleted 5 expired", out.getvalue())
+        self.assertEqual(
+            list(Session.objects.values_list("session_key", flat=True)),
+            [self.client.session.session_key],
+        )
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, CACHES=TEST_CACHES)
+class EventSeatsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = seed()
+        cls.student = CustomUser.objects.create_user(  # type: ignore
+            email="fresh@fs.cvut.cz", password="heslo123", fullname="Fresh Student"
+        )
+        cls.events = list(
+            LabEvent.get_feed().filter(close_login__gt=timezone.now() + timedelta(days=2))[:2]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.student)
+
+    def get_seats(self, **headers):
+        response = self.client.get(
+            reverse("api_event_seats"), {"id": [e.id for e in self.events]}, headers=headers
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        return [m for m in parse_sse(response.content) if m.get("event") == "seats"]
+
+    def test_seats(self):
+        (message,) = self.get_seats()
+        seats = json.loads(message["data"])
+        self.assertEqual([s["id"] for s in seats], [e.id for e in self.events])
+        self.assertEqual(seats[0]["applied"], self.events[0].applied_count)
+        self.assertEqual(len(seats[0]["free_topics"]), self.events[0].free_topic_count)
+
+        # a reconnect without changes gets no message and queries only the session and user
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_seats(**{"Last-Event-ID": message["id"]}), [])
+
+    def test_claim_pushes_change(self):
+        with self.assertNumQueries(4):
+            (message,) = self.get_seats()
+        event = self.events[0]
+        topic_id = json.loads(message["data"])[0]["free_topics"][0]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            event.claim_seat(self.student, topic_id)
+
+        (changed,) = self.get_seats(**{"Last-Event-ID": message["id"]})
+        seats = json.loads(changed["data"])[0]
+        self.assertEqual(seats["applied"], event.applied_count + 1)
+        self.assertNotIn(topic_id, seats["free_topics"])
+
+    def test_invalid(self):
+        self.assertEqual(self.client.get(reverse("api_event_seats")).status_code, 400)
+        self.assertEqual(
+            self.client.get(reverse("api_event_seats"), {"id": "x"}).status_code, 400
+        )
+        self.client.logout()
+        self.assertEqual(
+            self.client.get(reverse("api_event_seats"), {"id": 1}).status_code, 401
+        )
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, CACHES=TEST_CACHES)
+class AsyncApiTestCase(TestCase):
+    """The async endpoints answer exactly like their sync counterparts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = seed()
+        cls.student = LinkTopicEvent.objects.filter(
+            user__isnull=False, event__lab_datetime__gt=timezone.now()
+        ).order_by("event__lab_datetime")[0].user
+        cls.factory = AsyncRequestFactory()
+
+    def setUp(self):
+        cache.clear()
+
+    def request(self, path: str, user, **params):
+        request = self.factory.get(path, params)
+        request.user = user
+        return request
+
+    async def assertSameResponse(self, view: str, request):
+        async_response = await getattr(api_async, view)(request)
+        sync_response = await sync_to_async(getattr(api, view))(request)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(json.loads(async_response.content), json.loads(sync_response.content))
+        return async_response
+
+    async def test_topics(self):
+        response = await self.assertSameResponse(
+            "all_topics", self.request(reverse("api_topics"), self.student)
+        )
+        request = self.request(reverse("api_topics"), self.student)
+        request.META["HTTP_IF_NONE_MATCH"] = response["ETag"]
+        self.assertEqual((await api_async.all_topics(request)).status_code, 304)
+
+    async def test_events(self):
+        path = reverse("api_events")
+        response = await self.assertSameResponse(
+            "get_lab_events", self.request(path, self.student, size=5)
+        )
+        content = json.loads(response.content)
+        self.assertTrue(any(event["applied"] for event in content["content"]))
+
+        await self.assertSameResponse(
+            "get_lab_events",
+            self.request(path, self.student, size=5, cursor=content["next"]),
+        )
+        await self.assertSameResponse("get_lab_events", self.request(path, self.student, page=2))
+        await self.assertSameResponse("get_lab_events", self.request(path, self.student, cursor="x"))
+        await self.assertSameResponse("get_lab_events", self.request(path, AnonymousUser()))
+
+    async def test_my_labs(self):
+        path = reverse("api_my_labs")
+        response = await self.assertSameResponse("get_my_labs", self.request(path, self.student))
+        self.assertTrue(json.loads(response.content)["content"])
+        await self.assertSameResponse("get_my_labs", self.request(path, AnonymousUser()))
+
+    async def test_seats_stream(self):
+        event = await LabEvent.objects.afirst()
+        request = self.request(reverse("api_event_seats"), self.student, id=event.id)  # type: ignore
+        stream = (await api_async.event_seats(request)).streaming_content  # type: ignore
+
+        self.assertTrue((await anext(stream)).startswith(b"retry:"))  # type: ignore
+        sync_response = await sync_to_async(api.event_seats)(request)
+        self.assertEqual(
+            parse_sse(await anext(stream)), parse_sse(sync_response.content)[1:]  # type: ignore
+        )
+        await stream.aclose()  # type: ignore
+
+    async def test_register_requests(self):
+        path = reverse("api_register_requests")
+        response = await self.assertSameResponse(
+            "get_reqister_requests", self.request(path, self.staff, size=4)
+        )
+        await self.assertSameResponse(
+            "get_reqister_requests",
+            self.request(path, self.staff, size=4, cursor=json.loads(response.content)["next"]),
+        )
+        await self.assertSameResponse("get_reqister_requests", self.request(path, self.staff, page=2))
+        await self.assertSameResponse("get_reqister_requests", self.request(path, self.student))
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_HASHERS,
+    CACHES=TEST_CACHES,
+    QUERY_BUDGET_ENABLED=True,
+    QUERY_BUDGETS={"api_events": 1},
+    QUERY_BUDGET_DEFAULT=10,
+)
+class QueryBudgetMiddlewareTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(  # type: ignore
+            email="student@fs.cvut.cz", password="heslo123", fullname="Student"
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_within_budget(self):
+        response = self.client.get(reverse("home"))
+        self.assertEqual(response["X-DB-Queries"], "2")
+        self.assertNotIn("X-Query-Budget-Exceeded", response)
+
+    def test_budget_exceeded(self):
+        with self.assertLogs("main.middleware", level="WARNING"):
+            response = self.client.get(reverse("api_events"))
+        self.assertEqual(response["X-Query-Budget-Exceeded"], "3/1")
+
+    @override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_DEFAULT=0)
+    async def test_async_path(self):
+        async def view(request):
+            await sync_to_async(list)(LabTopic.objects.all()[:1])
+            return HttpResponse(status=204)
+
+        middleware = QueryBudgetMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertLogs("main.middleware", level="WARNING"):
+            response = await middleware(AsyncRequestFactory().get("/"))
+        self.assertEqual(response["X-DB-Queries"], "1")
+        self.assertEqual(response["X-Query-Budget-Exceeded"], "1/0")
+
+
+class StaticFilesTestCase(SimpleTestCase):
+    def test_hashed_precompressed(self):
+        # stylesheets only, brotli takes seconds for the fonts and admin files
+        source = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        for name in ("home.css", "variables.css"):
+            shutil.copy(settings.BASE_DIR / "main" / "static" / name, source.name)
+
+        with tempfile.TemporaryDirectory() as root, override_settings(
+            STATIC_ROOT=root,
+            STATICFILES_DIRS=[source.name],
+            STATICFILES_FINDERS=["django.contrib.staticfiles.finders.FileSystemFinder"],
+            STORAGES={
+                **settings.STORAGES,
+                "staticfiles": {
+                    "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"
+                },
+            },
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            url = static("home.css")
+            self.assertRegex(url, r"^/static/home\.[0-9a-f]{12}\.css$")
+            name = url.removeprefix("/static/")
+            for suffix in ("", ".gz", ".br"):
+                self.assertTrue(os.path.exists(os.path.join(root, name + suffix)))
+
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, br")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Encoding"], "br")
+            self.assertIn("immutable", response["Cache-Control"])
+            response.close()
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, CACHES=TEST_CACHES, PROFILING_ENABLED=True)
+class ProfilingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = seed()
+        cls.student = CustomUser.objects.filter(is_staff=False, approved=True).first()
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        profiling_dir = override_settings(PROFILING_DIR=self.directory)
+        profiling_dir.enable()
+        self.addCleanup(profiling_dir.disable)
+
+    def test_cprofile(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(
+            reverse("api_events"), {"size": 5}, HTTP_X_PROFILE="1", HTTP_X_REQUEST_ID="req-1"
+        )
+        self.assertEqual(response["X-Profile-Id"], "req-1")
+
+        stats = pstats.Stats(str(self.directory / "req-1.prof"))
+        self.assertTrue(any(func[2] == "get_lab_events" for func in stats.stats))  # type: ignore
+        log = json.loads((self.directory / "req-1.sql.json").read_text())
+        self.assertEqual(log["path"], reverse("api_events") + "?size=5")
+        self.assertTrue(any("main_labevent" in query["sql"] for query in log["queries"]))
+
+    def test_sample(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(
+            reverse("home"), {"_profile": "sample"}, HTTP_X_REQUEST_ID="../etc"
+        )
+        rid = response["X-Profile-Id"]
+        self.assertRegex(rid, r"^[0-9a-f]{32}$")
+        self.assertTrue((self.directory / f"{rid}.collapsed").exists())
+        self.assertTrue((self.directory / f"{rid}.sql.json").exists())
+
+    async def test_async_path(self):
+        async def view(request):
+            await sync_to_async(list)(LabTopic.objects.all()[:1])
+            return HttpResponse(status=204)
+
+        middleware = ProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = AsyncRequestFactory().get(
+            "/", headers={"X-Profile": "sample", "X-Request-ID": "req-2"}
+        )
+        request.user = self.staff
+        response = await middleware(request)
+
+        self.assertEqual(response["X-Profile-Id"], "req-2")
+        self.assertTrue((self.directory / "req-2.collapsed").exists())
+        log = json.loads((self.directory / "req-2.sql.json").read_text())
+        self.assertEqual(len(log["queries"]), 1)
+
+        request = AsyncRequestFactory().get("/", headers={"X-Profile": "1"})
+        request.user = self.student
+        response = await middleware(request)
+        self.assertNotIn("X-Profile-Id", response)
+
+    def test_staff_only(self):
+        self.client.force_login(self.student)
+        response = self.client.get(reverse("home"), HTTP_X_PROFILE="1")
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_HASHERS,
+    CACHES=TEST_CACHES,
+    METRICS_ENABLED=True,
+    METRICS_TOKEN="scrape",
+)
+class MetricsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = seed()
+        cls.event = LabEvent.objects.filter(
+            close_login__gt=timezone.now() + timedelta(days=2)
+        ).order_by("lab_datetime")[0]
+        cls.student = CustomUser.objects.create_user(  # type: ignore
+            email="fresh@fs.cvut.cz", password="heslo123", fullname="Fresh Student"
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    @staticmethod
+    def value(name: str, **labels) -> float:
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    def test_requests(self):
+        before = (
+            self.value("labs_responses_total", view="api_events", status="200"),
+            self.value("labs_request_duration_seconds_count", view="api_events", method="GET"),
+            self.value("labs_db_queries_total", view="api_events"),
+        )
+        self.client.force_login(self.student)
+        self.client.get(reverse("api_events"))
+
+        after = (
+            self.value("labs_responses_total", view="api_events", status="200"),
+            self.value("labs_request_duration_seconds_count", view="api_events", method="GET"),
+            self.value("labs_db_queries_total", view="api_events"),
+        )
+        self.assertEqual(after[0] - before[0], 1)
+        self.assertEqual(after[1] - before[1], 1)
+        self.assertEqual(after[2] - before[2], 4)
+
+    def test_seat_claims_and_exports(self):
+        claimed = self.value("labs_seat_claims_total", result="claimed")
+        exports = self.value("labs_export_duration_seconds_count", export="history")
+
+        self.client.force_login(self.student)
+        self.client.post(
+            reverse("apply_event", args=[self.event.id]) + "?operation=apply",  # type: ignore
+            {"topics": self.event.get_roster(self.student).free_topics[0][0]},
+        )
+        self.client.force_login(self.staff)
+        b"".join(self.client.get(reverse("api_export_history")).streaming_content)  # type: ignore
+
+        self.assertEqual(self.value("labs_seat_claims_total", result="claimed") - claimed, 1)
+        self.assertEqual(
+            self.value("labs_export_duration_seconds_count", export="history") - exports, 1
+        )
+
+    def test_endpoint_access(self):
+        self.assertEqual(self.client.get(reverse("api_metrics")).status_code, 403)
+        response = self.client.get(reverse("api_metrics"), HTTP_AUTHORIZATION="Bearer scrape")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"labs_seat_claims_total", response.content)
+
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(reverse("api_metrics")).status_code, 403)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse("api_metrics")).status_code, 200)
+
+    async def test_async_path(self):
+        async def view(request):
+            await sync_to_async(list)(LabTopic.objects.all()[:1])
+            return HttpResponse(status=204)
+
+        middleware = MetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+
+        before = self.value("labs_responses_total", view="-", status="204")
+        queries = self.value("labs_db_queries_total", view="-")
+        response = await middleware(AsyncRequestFactory().get("/"))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.value("labs_responses_total", view="-", status="204") - before, 1)
+        self.assertEqual(self.value("labs_db_queries_total", view="-") - queries, 1)
+
+    def test_multiprocess(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        script = "from main import metrics; metrics.SEAT_CLAIMS.labels('claimed').inc(2)"
+        for _ in range(3):
+            subprocess.run(
+                [sys.executable, "-c", script],
+                cwd=settings.BASE_DIR,
+                env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": directory.name},
+                check=True,
+            )
+
+        with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory.name}):
+            exposition = metrics.exposition().decode()
+        self.assertIn('labs_seat_claims_total{result="claimed"} 6.0', exposition)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, CACHES=TEST_CACHES)
+class ExportJobTestCase(TransactionTestCase):
+    """Transactions are real here, the worker closes its connection when done."""
+
+    def setUp(self):
+        self.staff = seed()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        export_root = override_settings(EXPORT_ROOT=self.directory)
+        export_root.enable()
+        self.addCleanup(export_root.disable)
+        self.client.force_login(self.staff)
+
+    def request(self, kind: str = "history"):
+        return self.client.post(
+            reverse("api_export_jobs"), {"kind": kind}, content_type="application/json"
+        )
+
+    def work(self) -> str:
+        out = StringIO()
+        call_command("run_export_jobs", "--once", stdout=out)
+        return out.getvalue()
+
+    def test_request_reuses_job(self):
+        response = self.request()
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual((job["status"], job["download"]), ("pending", None))
+
+        response = self.request()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], job["id"])
+        self.assertEqual(self.request("closed").status_code, 202)
+
+        link = LinkTopicEvent.objects.filter(
+            user__isnull=False, event__lab_datetime__lt=timezone.now()
+        ).first()
+        link.event.release_seat(link.user)
+        response = self.request()
+        self.assertEqual(response.status_code, 202)
+        self.assertNotEqual(response.json()["id"], job["id"])
+
+    def test_worker_writes_export(self):
+        job = self.request().json()
+        self.work()
+
+        job = self.client.get(reverse("api_export_job", args=[job["id"]])).json()
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["rows"], NUM_PAST_EVENTS * TOPICS_PER_EVENT)
+        self.assertEqual(
+            list(self.directory.iterdir()), [self.directory / f"{job['id']}-history.csv"]
+        )
+
+        response = self.client.get(job["download"])
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="history_labs.csv"'
+        )
+        content = b"".join(response.streaming_content)  # type: ignore
+        response.close()
+        response = self.client.get(reverse("api_export_history"))
+        self.assertEqual(content, b"".join(response.streaming_content))  # type: ignore
+
+        # finished jobs are reused until they expire
+        self.assertEqual(self.request().json()["id"], job["id"])
+
+    def test_failed_job_retried(self):
+        job = self.request().json()
+        with mock.patch.object(ExportJob, "run", side_effect=OSError("disk full")):
+            with self.assertLogs("main.management.commands.run_export_jobs", "ERROR"):
+                self.work()
+
+        job = ExportJob.objects.get(pk=job["id"])
+        self.assertEqual((job.status, job.attempts), (ExportJob.Status.FAILED, 3))
+        self.assertEqual(job.error, "OSError: disk full")
+        # failed jobs are not reused
+        self.assertEqual(self.request().status_code, 202)
+
+    def test_stale_job_requeued(self):
+        job = ExportJob.objects.get(pk=self.request().json()["id"])
+        long_ago = timezone.now() - settings.EXPORT_JOB_TIMEOUT - timedelta(minutes=1)
+        ExportJob.objects.filter(pk=job.pk).update(
+            status=ExportJob.Status.RUNNING,
+            attempts=1,
+            started_at=long_ago,
+            heartbeat=long_ago,
+        )
+        with self.assertLogs("main.management.commands.run_export_jobs", "WARNING"):
+            self.work()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ExportJob.Status.DONE, 2))
+
+    def test_long_running_job_kept(self):
+        job = ExportJob.objects.get(pk=self.request().json()["id"])
+        ExportJob.objects.filter(pk=job.pk).update(
+            status=ExportJob.Status.RUNNING,
+            attempts=1,
+            started_at=timezone.now() - 10 * settings.EXPORT_JOB_TIMEOUT,
+            heartbeat=timezone.now(),
+        )
+        self.work()
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).status, ExportJob.Status.RUNNING)
+
+    def test_stale_job_failed_after_max_attempts(self):
+        job = ExportJob.objects.get(pk=self.request().json()["id"])
+        ExportJob.objects.filter(pk=job.pk).update(
+            status=ExportJob.Status.RUNNING,
+            attempts=ExportJob.MAX_ATTEMPTS,
+            heartbeat=timezone.now() - settings.EXPORT_JOB_TIMEOUT - timedelta(minutes=1),
+        )
+        with self.assertLogs("main.management.commands.run_export_jobs", "WARNING"):
+            self.work()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (ExportJob.Status.FAILED, "worker lost"))
+
+    def test_requeued_job_abandoned(self):
+        self.request()
+        job: ExportJob = ExportJob.claim_next()  # type: ignore
+        # requeued and claimed by another worker meanwhile
+        ExportJob.objects.filter(pk=job.pk).update(attempts=job.attempts + 1)
+
+        with self.assertRaises(ExportJobLost):
+            job.run(chunk_size=5)
+        self.assertEqual(list(self.directory.iterdir()), [])
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).status, ExportJob.Status.RUNNING)
+
+    def test_retention(self):
+        job = self.request().json()
+        self.work()
+        ExportJob.objects.filter(pk=job["id"]).update(
+            finished_at=timezone.now() - settings.EXPORT_RETENTION - timedelta(minutes=1)
+        )
+        # left by a worker killed while writing
+        (self.directory / f"{job['id']}-history.csv.1.part").touch()
+        self.assertIn("deleted 1 expired export(s)", self.work())
+        self.assertFalse(ExportJob.objects.exists())
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    def test_download_not_ready(self):
+        job = self.request().json()
+        response = self.client.get(reverse("api_export_job_download", args=[job["id"]]))
+        self.assertEqual(response.status_code, 409)
+
+        self.assertEqual(self.request("everything").status_code, 400)
+
+    def test_staff_only(self):
+        job = self.request().json()
+        self.client.force_login(CustomUser.objects.filter(is_staff=False).first())
+        self.assertEqual(self.request().status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse("api_export_job", args=[job["id"]])).status_code, 403
+        )
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.opened: list[FakeConnection] = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+    def pool(self, **kwargs):
+        options = {
+            "size": 2,
+            "timeout": 0.05,
+            "max_lifetime": 100.0,
+            "ping": lambda raw: raw.healthy,
+            "clock": lambda: self.now,
+        }
+        return ConnectionPool(self.connect, **{**options, **kwargs})
+
+    def test_reuses_released_connection(self):
+        pool = self.pool()
+        raw, _ = pool.acquire()
+        pool.release(raw)
+        self.assertIs(pool.acquire()[0], raw)
+        self.assertEqual(pool.stats()["created"], 1)
+        self.assertEqual(pool.stats()["checkouts"], 2)
+
+    def test_bounded(self):
+        pool = self.pool(clock=time.monotonic)
+        pool.acquire()
+        pool.acquire()
+        with self.assertRaises(PoolTimeout), self.assertLogs("main.backends.pool", "WARNING"):
+            pool.acquire()
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(pool.stats()["timeouts"], 1)
+
+    def test_waits_for_release(self):
+        pool = self.pool(size=1, timeout=5.0, clock=time.monotonic)
+        raw, _ = pool.acquire()
+        releaser = threading.Timer(0.05, pool.release, [raw])
+        releaser.start()
+        try:
+            other, wait = pool.acquire()
+        finally:
+            releaser.join()
+        self.assertIs(other, raw)
+        self.assertGreater(wait, 0)
+        self.assertEqual(pool.stats()["waits"], 1)
+
+    def test_health_check_on_checkout(self):
+        pool = self.pool()
+        raw, _ = pool.acquire()
+        pool.release(raw)
+        raw.healthy = False
+
+        fresh, _ = pool.acquire()
+        self.assertIsNot(fresh, raw)
+        self.assertTrue(raw.closed)
+        self.assertEqual(pool.stats()["discarded"], 1)
+        self.assertEqual(pool.stats()["open"], 1)
+
+    def test_ping_only_after_idle(self):
+        pool = self.pool(ping_after=10.0)
+        raw, _ = pool.acquire()
+        pool.release(raw)
+        raw.healthy = False
+        self.assertIs(pool.acquire()[0], raw)
+
+    def test_max_lifetime(self):
+        pool = self.pool()
+        raw, _ = pool.acquire()
+        pool.release(raw)
+        self.now = 100.0
+        self.assertIsNot(pool.acquire()[0], raw)
+        self.assertTrue(raw.closed)
+
+    def test_discard_frees_slot(self):
+        pool = self.pool(size=1)
+        raw, _ = pool.acquire()
+        pool.release(raw, discard=True)
+        self.assertTrue(raw.closed)
+        self.assertIsNot(pool.acquire()[0], raw)
+
+    def test_failed_connect_frees_slot(self):
+        def connect():
+            raise ConnectionError()
+
+        pool = ConnectionPool(connect, size=1, timeout=0.05)
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                pool.acquire()
+        self.assertEqual(pool.stats()["open"], 0)
+
+    def test_pooled_backend_shipped(self):
+        self.assertIsNotNone(importlib.util.find_spec("main.backends.pooled_mysql.base"))
+
+    @skipUnless(importlib.util.find_spec("MySQLdb"), "mysqlclient is not installed")
+    def test_load_pooled_backend(self):
+        backend = load_backend("main.backends.pooled_mysql")
+        self.assertTrue(issubclass(backend.DatabaseWrapper, PooledDatabaseWrapperMixin))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, CACHES=TEST_CACHES)
+class BenchmarkTestCase(TransactionTestCase):
+    """Smoke runs of the benchmarks on a tiny seed. The rush threads need committed
+    data and one at a time, the shared cache of the in-memory SQLite database locks
+    whole tables."""
+
+    def test_rush(self):
+        out = StringIO()
+        call_command(
+            "bench_rush",
+            users=6,
+            events=2,
+            topics=3,
+            capacity=2,
+            concurrency=1,
+            polls=1,
+            stdout=out,
+        )
+        output = out.getvalue()
+        self.assertIn("in-process", output)
+        self.assertIn("overbooked events: 0, users over limit: 0, counter drift: 0", output)
+        self.assertFalse(
+            CustomUser.objects.filter(email__startswith=benchmark.BENCH_EMAIL_PREFIX).exists()
+        )
+
+    def test_rush_fails_on_server_errors(self):
+        self.assertTrue(benchmark.is_failure(0))
+        self.assertTrue(benchmark.is_failure(503))
+        self.assertFalse(benchmark.is_failure(409))
+
+        with mock.patch.object(
+            benchmark.InProcessTransport, "request", return_value=(500, None)
+        ), self.assertRaisesMessage(CommandError, "in-process"):
+            call_command(
+                "bench_rush",
+                users=2,
+                events=1,
+                topics=2,
+                capacity=1,
+                concurrency=1,
+                polls=1,
+                stdout=StringIO(),
+            )
+
+    def test_indexes(self):
+        out = StringIO()
+        call_command("bench_indexes", users=20, events=4, pending=5, repeat=2, stdout=out)
+        output = out.getvalue()
+        for name in ("roster", "free seat", "can_apply", "approval queue", "speedup"):
+            self.assertIn(name, output)
+
+        with connection.cursor() as cursor:
+            indexes = set()
+            for model, _ in benchmark.APP_INDEXES:
+                indexes |= set(
+                    connection.introspection.get_constraints(cursor, model._meta.db_table)
+                )
+        self.assertLessEqual({index.name for _, index in benchmark.APP_INDEXES}, indexes)
+        self.assertFalse(
+            CustomUser.objects.filter(email__startswith=benchmark.BENCH_EMAIL_PREFIX).exists()
+        )
@@ -1,6 +1,11 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 from . import api
+from . import api_async
+
+# read heavy endpoints, async under ASGI
+read_api = api_async if settings.ASYNC_API else api
 
 
 urlpatterns = [
@@ -17,13 +22,17 @@ urlpatterns = [
     path("approve/", views.approve_registration_page, name="approve_page"),
     path("my_labs/", views.my_labs, name="my_labs"),
     path("export/", views.export_page, name="export"),
-    path("api/topic/all", api.all_topics, name="api_topics"),
+    path("api/topic/all", read_api.all_topics, name="api_topics"),
     path("api/topic/create", api.new_topic, name="api_new_topic"),
     path("api/topic/delete", api.remove_topic, name="api_remove_topic"),
     path("api/topic/modify", api.modify_topic, name="api_modify_topic"),
-    path("api/event/all", api.get_lab_events, name="api_events"),
+    path("api/event/all", read_api.get_lab_events, name="api_events"),
+    path("api/event/schedule", api.create_schedule, name="api_create_schedule"),
+    path("api/event/seats", read_api.event_seats, name="api_event_seats"),
+    path("api/event/mine", read_api.get_my_labs, name="api_my_labs"),
     path("api/approve/<int:id>", api.approve_user, name="api_approve_user"),
     path("api/decline/<int:id>", api.decline_user, name="api_decline_user"),
+    path("api/requests/resolve", api.resolve_requests, name="api_resolve_requests"),
     path(
         "api/event/<int:event_id>/user/<int:user_id>",
         api.remove_user_from_event,
@@ -31,5 +40,13 @@ urlpatterns = [
     ),
     path("api/export/closed", api.export_closed, name="api_export_closed"),
     path("api/export/history", api.export_history, name="api_export_history"),
-    path("api/requests/", api.get_reqister_requests, name="api_register_requests"),
+    path("api/export/jobs", api.export_jobs, name="api_export_jobs"),
+    path("api/export/jobs/<int:id>", api.export_job, name="api_export_job"),
+    path(
+        "api/export/jobs/<int:id>/download",
+        api.export_job_download,
+        name="api_export_job_download",
+    ),
+    path("api/metrics", api.get_metrics, name="api_metrics"),
+    path("api/requests/", read_api.get_reqister_requests, name="api_register_requests"),
 ]
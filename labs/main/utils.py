@@ -1,9 +1,13 @@
+import base64
+import json
+from datetime import datetime
 from typing import Protocol, TYPE_CHECKING
 from django.shortcuts import render as _render
 from django.http import HttpRequest
+from django.db.models import Q, QuerySet
 
 if TYPE_CHECKING:
-    from .models import LabEvent
+    from .models import LabEvent, EventRoster
     from .forms import ApplyEventForm
 
 
@@ -15,6 +19,12 @@ class DateFormatable(Protocol):
 REPR_FORMAT = r"%d.%m.%Y %H:%M"
 OFFICIAL_FORMAT = r"%Y-%m-%d %H:%M:%S"
 
+MAX_PAGE_SIZE: int = 50
+
+
+class InvalidCursor(ValueError):
+    pass
+
 
 def repr_format(d: DateFormatable):
     return d.strftime(REPR_FORMAT)
@@ -24,6 +34,82 @@ def official_format(d: DateFormatable):
     return d.strftime(OFFICIAL_FORMAT)
 
 
+class Echo:
+    """Pseudo buffer returning what is written, lets `csv.writer` produce lines for streaming."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def iterate_in_chunks(queryset: QuerySet, chunk_size: int):
+    """Iterate `queryset` ordered by primary key, fetching `chunk_size` rows per query.
+
+    Unlike `QuerySet.iterator` this keeps memory flat on MySQL too, whose
+    driver buffers the whole result set of a single query on the client.
+    """
+    queryset = queryset.order_by("pk")
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1].pk
+
+
+def encode_cursor(value: datetime, pk: int) -> str:
+    raw = json.dumps([value.isoformat(), pk]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(value), int(pk)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"invalid cursor `{cursor}`") from e
+
+
+def keyset_query(queryset: QuerySet, field: str, cursor: str | None) -> QuerySet:
+    """`queryset` ordered by `(field, id)` starting after `cursor`."""
+    queryset = queryset.order_by(field, "id")
+
+    if cursor is not None:
+        value, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f"{field}__gte": value}),
+            Q(**{f"{field}__gt": value}) | Q(id__gt=pk),
+        )
+    return queryset
+
+
+def keyset_page(queryset: QuerySet, field: str, cursor: str | None, size: int):
+    """Return one page of `queryset` ordered by `(field, id)` and the cursor of the next page.
+
+    Rows are located by an index range scan from the cursor instead of
+    `COUNT(*)` + `OFFSET`, so every page costs the same regardless of depth.
+    """
+    rows = list(keyset_query(queryset, field, cursor)[: size + 1])
+    return _split_page(rows, field, size)
+
+
+async def akeyset_page(queryset: QuerySet, field: str, cursor: str | None, size: int):
+    """Async `keyset_page`."""
+    rows = [row async for row in keyset_query(queryset, field, cursor)[: size + 1]]
+    return _split_page(rows, field, size)
+
+
+def _split_page(rows: list, field: str, size: int):
+    # one row more than `size` is fetched to know whether there is a next page
+    if len(rows) <= size:
+        return rows, None
+
+    rows = rows[:size]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, field), last.pk)
+
+
 def render_error(request: HttpRequest, errors: list[str]):
     return _render(request, "error_page.html", {"errors": errors})
 
@@ -35,24 +121,30 @@ def render_event_page(
     login_message: str = "",
     logout_message: str = "",
     general_error: str = "",
-    num_applied_users: int | None = None,
+    status: int = 200,
+    roster: "EventRoster | None" = None,
 ):
+    if roster is None:
+        roster = event.get_roster(request.user)
+
     if request.user.is_staff:  # type: ignore
         return _render(
             request,
             "apply_event.html",
-            {"event": event},
+            {"event": event, "roster": roster},
+            status=status,
         )
     return _render(
         request,
         "apply_event.html",
         {
             "event": event,
+            "roster": roster,
             "form": form,
             "any_free_topics": form is not None and len(form.choices) != 0,
             "logout_message": logout_message,
             "login_message": login_message,
             "general_error": general_error,
-            "num_applied_users": num_applied_users,
         },
+        status=status,
     )
@@ -11,10 +11,18 @@ from .forms import (
     LoginForm,
     RegisterForm,
     ValidationError,
-    CreateEventForm,
+    CreateScheduleForm,
     ApplyEventForm,
 )
-from .models import CustomUser, LabTopic, LabEvent, LinkTopicEvent, MAX_USER_APPLIES
+from .models import (
+    CustomUser,
+    LabTopic,
+    LabEvent,
+    LinkTopicEvent,
+    SeatClaim,
+    MAX_USER_APPLIES,
+)
+from . import metrics
 from .utils import render_error, render_event_page
 
 from django.contrib.admin.views.decorators import staff_member_required
@@ -187,67 +195,76 @@ def show_topics(request: HttpRequest):
 @staff_member_required(redirect_field_name="home")
 def create_event(request: HttpRequest):
     topics = [(topic.id, topic.title) for topic in LabTopic.objects.all()]  # type: ignore
-    form = CreateEventForm(topics, initial={"capacity": 1})
+    form = CreateScheduleForm(topics, initial={"capacity": 1})
 
     if request.method == "POST":
-        form = CreateEventForm(topics, request.POST)
+        form = CreateScheduleForm(topics, request.POST)
         if not form.is_valid():
             return render(request, "create_event.html", {"form": form})
 
-        lab_event = LabEvent(
-            capacity=form.cleaned_data["capacity"],
-            close_login=form.cleaned_data["close_login"],
-            close_logout=form.cleaned_data["close_logout"],
-            lab_datetime=form.cleaned_data["lab_datetime"],
-        )
-        lab_event.created_by = request.user  # type: ignore
         try:
-            lab_event.save()
+            LabEvent.create_schedule(**form.schedule(), created_by=request.user)
         except ValidationError as e:
+            form.add_error(None, e)
             return render(request, "create_event.html", {"form": form})
 
-        for topic_id in form.cleaned_data["topics"]:
-            lab_topic = LabTopic.objects.get(pk=int(topic_id))
-            lab_event.topics.add(lab_topic)
-
         return redirect("home")
 
     return render(request, "create_event.html", {"form": form})
 
 
-def apply_event(request: HttpRequest, event: LabEvent, form: ApplyEventForm):
-    if event.close_login < timezone.now():
-        return render_event_page(
-            request, event, form, login_message="Čas na přihlášení vypršel"
-        )
+def apply_form(free_topics: list[tuple[int, str]], data=None) -> ApplyEventForm:
+    if not free_topics:
+        return ApplyEventForm()
 
-    if event.capacity <= (num_applied_users := event.get_number_applied_users()):
-        return render_event_page(
-            request, event, form, num_applied_users=num_applied_users
-        )
+    return ApplyEventForm(
+        free_topics,  # type: ignore
+        data,
+        initial={"topics": free_topics[0][0]},  # type: ignore
+    )
 
-    if not request.user.can_apply():  # type: ignore
-        return render_event_page(
-            request,
-            event,
-            form,
-            num_applied_users=num_applied_users,
-            general_error=f"Maximální počet přihlášených cvičení je: {MAX_USER_APPLIES}",
-        )
 
-    if form.is_valid():
-        topic_id = int(form.cleaned_data["topics"])
-        topic = LabTopic.objects.get(pk=topic_id)
+def apply_event(request: HttpRequest, event: LabEvent, form: ApplyEventForm):
+    topic_id = request.POST.get("topics", "")
+    if not topic_id.isdigit():
+        return render_event_page(request, event, form)
 
-        link = LinkTopicEvent.objects.filter(event=event, topic=topic).first()
-        # handle link is None
+    result = event.claim_seat(request.user, int(topic_id))  # type: ignore
+    metrics.SEAT_CLAIMS.labels(result.name.lower()).inc()
 
-        if link.user is None:
-            link.user = request.user
-            link.save()
+    match result:
+        case SeatClaim.CLAIMED | SeatClaim.ALREADY_APPLIED:
             return redirect("apply_event", id=event.id)  # type: ignore
-
-    return render_event_page(request, event, form, num_applied_users=num_applied_users)
+        case SeatClaim.CLOSED:
+            return render_event_page(
+                request, event, form, login_message="Čas na přihlášení vypršel"
+            )
+        case SeatClaim.LIMIT_REACHED:
+            return render_event_page(
+                request,
+                event,
+                form,
+                general_error=f"Maximální počet přihlášených cvičení je: {MAX_USER_APPLIES}",
+            )
+        case SeatClaim.FULL:
+            roster = event.get_roster(request.user)
+            return render_event_page(
+                request,
+                event,
+                apply_form(roster.free_topics),
+                status=409,
+                roster=roster,
+            )
+        case SeatClaim.TAKEN:
+            roster = event.get_roster(request.user)
+            return render_event_page(
+                request,
+                event,
+                apply_form(roster.free_topics),
+                general_error="Téma bylo mezitím obsazeno, vyberte prosím jiné",
+                status=409,
+                roster=roster,
+            )
 
 
 def logout_event(request: HttpRequest, event: LabEvent, form: ApplyEventForm):
@@ -256,15 +273,7 @@ def logout_event(request: HttpRequest, event: LabEvent, form: ApplyEventForm):
             request, event, form, logout_message="Čas na odhlášení vypršel"
         )
 
-    topic = event.get_user_topic(request.user)
-
-    link = LinkTopicEvent.objects.filter(
-        user=request.user, event=event, topic=topic
-    ).first()
-
-    if link is not None:
-        link.user = None
-        link.save()
+    event.release_seat(request.user)  # type: ignore
 
     return redirect("apply_event", id=event.id)  # type: ignore
 
@@ -276,20 +285,12 @@ def event_page(request: HttpRequest, id: int):
     except LabEvent.DoesNotExist:
         return render_error(request, ["Cvičení neexistuje!"])
 
-    free_topics = event.get_free_topics_radios()
-
-    if not free_topics:
-        form = ApplyEventForm()
-    else:
-        form = ApplyEventForm(
-            free_topics,  # type: ignore
-            request.POST or None,
-            initial={"topics": free_topics[0][0]},  # type: ignore
-        )
+    roster = event.get_roster(request.user)
+    form = apply_form(roster.free_topics, request.POST or None)
 
     if request.method == "POST":
         if request.user.is_staff:  # type: ignore
-            return render_event_page(request, event, form)
+            return render_event_page(request, event, form, roster=roster)
 
         operation = request.GET.get("operation")
 
@@ -301,7 +302,7 @@ def event_page(request: HttpRequest, id: int):
             case _:
                 raise Exception("unsupported value for `operation`")
 
-    return render_event_page(request, event, form)
+    return render_event_page(request, event, form, roster=roster)
 
 
 @login_required